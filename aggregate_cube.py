@@ -0,0 +1,61 @@
+from os.path import isfile
+import pandas as pd
+from atomic_files import atomic_write
+
+CUBE_FILE_NAME = "aggregate_cube.csv"
+CUBE_BLOCK_SIZE = 10000 #rides per block, only blocks holding a new, changed or removed ride are aggregated again
+CUBE_KEYS = ["Year", "Weekday", "Hour", "Method"] #weekday 0 is Monday, method is "Public Transit" or "Ride Share"
+CUBE_MEASURES = ["Walking", "Transit", "Waiting"] #minutes
+CUBE_DTYPES = {"Block": "int64",
+               "Year": "int16",
+               "Weekday": "int8",
+               "Hour": "int8",
+               "Method": "string",
+               "Rides": "int64",
+               "Walking": "float64",
+               "Transit": "float64",
+               "Waiting": "float64"}
+
+
+def empty_cube() -> pd.core.frame.DataFrame:
+    return pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in CUBE_DTYPES.items()})
+
+
+def load_cube(path: str = CUBE_FILE_NAME) -> pd.core.frame.DataFrame:
+    """Retrieves the aggregate cube, or an empty one when it has not been written yet."""
+    if not isfile(path):
+        return empty_cube()
+
+    return pd.read_csv(path, dtype=CUBE_DTYPES)
+
+
+def save_cube(cube: pd.core.frame.DataFrame, path: str = CUBE_FILE_NAME):
+    with atomic_write(path) as temp_path:
+        cube.to_csv(temp_path, index=False)
+
+
+def aggregate_cells(df: pd.core.frame.DataFrame, method: str, block_size: int = CUBE_BLOCK_SIZE) -> pd.core.frame.DataFrame:
+    """Sums the walking, transit and waiting minutes of rides and counts them per block, year, weekday and hour.
+
+    df holds one row per ride with an ID column, the year, weekday and hour of its request, and its minutes."""
+    rows = df.dropna(subset=CUBE_MEASURES).assign(Block=df["ID"] // block_size, Method=method)
+    grouped = rows.groupby(["Block", *CUBE_KEYS], observed=True)
+    cells = grouped[CUBE_MEASURES].sum()
+    cells.insert(0, "Rides", grouped.size())
+
+    return cells.reset_index().astype(CUBE_DTYPES)[list(CUBE_DTYPES)]
+
+
+def replace_blocks(cube: pd.core.frame.DataFrame, blocks, cells: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Swaps the cells of the given blocks for freshly aggregated ones. None replaces every block.
+
+    Cells aggregated from separate chunks of the same block are added together."""
+    cells = cells.groupby(["Block", *CUBE_KEYS], as_index=False, observed=True)[["Rides", *CUBE_MEASURES]].sum().astype(CUBE_DTYPES)
+    kept = cube.iloc[0:0] if blocks is None else cube[~cube["Block"].isin(blocks)]
+    return pd.concat([kept, cells], ignore_index=True).sort_values(["Block", *CUBE_KEYS], ignore_index=True)
+
+
+def cube_means(cube: pd.core.frame.DataFrame, by: list) -> pd.core.frame.DataFrame:
+    """Average walking, transit and waiting minutes per ride for each combination of the given keys."""
+    totals = cube.groupby(by, observed=True)[["Rides", *CUBE_MEASURES]].sum()
+    return totals[CUBE_MEASURES].div(totals["Rides"], axis=0)
@@ -0,0 +1,200 @@
+import argparse
+import json
+import mmap
+import struct
+import zlib
+from os import listdir
+from os.path import isdir, join
+import numpy as np
+from archive_store import DEFAULT_ARCHIVE_DIR, ArchiveStore, decode_json
+from atomic_files import atomic_write
+
+DEFAULT_PACK_PATH = "2023_archive.pack"
+PACK_BLOCK_SIZE = 65536 #bytes of serialized results compressed together, a lookup decompresses one block
+PACK_COMPRESSION_LEVEL = 6
+
+PACK_MAGIC = b"EPPACK01"
+HEADER = struct.Struct("<8sQQQ") #magic, entry count, block count, offset of the index
+#the index holds one fixed-width column after another, each sorted by ride id, followed by the block table
+INDEX_COLUMNS = [("ride_id", "<i8"), ("version", "<i8"), ("block", "<u4"), ("start", "<u4"), ("length", "<u4")]
+BLOCK_COLUMNS = [("offset", "<u8"), ("length", "<u8")] #position and compressed size of each block in the file
+
+
+def write_pack(entries, path: str, block_size: int = PACK_BLOCK_SIZE) -> int:
+    """Writes (ride id, version, serialized result) entries, sorted by ride id, into a pack file. Returns the number written.
+
+    Entries are appended to a block until it holds block_size bytes, every block is compressed on its own."""
+    index = {name: [] for name, dtype in INDEX_COLUMNS}
+    blocks = {name: [] for name, dtype in BLOCK_COLUMNS}
+    block = bytearray()
+    previous_id = None
+
+    def flush_block(file):
+        compressed = zlib.compress(bytes(block), PACK_COMPRESSION_LEVEL)
+        blocks["offset"].append(file.tell())
+        blocks["length"].append(len(compressed))
+        file.write(compressed)
+        block.clear()
+
+    with atomic_write(path) as temp_path, open(temp_path, 'wb') as file:
+        file.write(HEADER.pack(PACK_MAGIC, 0, 0, 0)) #rewritten once the entries are in
+
+        for ride_id, version, body in entries:
+            if previous_id is not None and ride_id <= previous_id:
+                raise ValueError(f"pack entries must be sorted by unique ride id, {ride_id} follows {previous_id}")
+            previous_id = ride_id
+
+            encoded = body.encode() if isinstance(body, str) else body
+            index["ride_id"].append(ride_id)
+            index["version"].append(version)
+            index["block"].append(len(blocks["offset"]))
+            index["start"].append(len(block))
+            index["length"].append(len(encoded))
+            block.extend(encoded)
+            if len(block) >= block_size:
+                flush_block(file)
+
+        if block:
+            flush_block(file)
+
+        file.write(b"\0" * (-file.tell() % 8)) #aligns the index so it can be searched in place
+        index_offset = file.tell()
+        for name, dtype in INDEX_COLUMNS:
+            file.write(np.asarray(index[name], dtype=dtype).tobytes())
+        for name, dtype in BLOCK_COLUMNS:
+            file.write(np.asarray(blocks[name], dtype=dtype).tobytes())
+
+        file.seek(0)
+        file.write(HEADER.pack(PACK_MAGIC, len(index["ride_id"]), len(blocks["offset"]), index_offset))
+
+    return len(index["ride_id"])
+
+
+def archive_dir_entries(archive_dir: str):
+    """Streams the <id>.json files of a legacy archive directory as pack entries, compacted like the archive store keeps them.
+
+    Files carry no version, every entry gets version 0."""
+    if not isdir(archive_dir):
+        raise FileNotFoundError(f"archive directory not found: {archive_dir}")
+
+    ride_ids = sorted(int(file_name.removesuffix(".json")) for file_name in listdir(archive_dir) if file_name.endswith(".json"))
+    for ride_id in ride_ids:
+        with open(join(archive_dir, f"{ride_id}.json"), 'r') as file:
+            yield ride_id, 0, json.dumps(json.load(file), separators=(",", ":"))
+
+
+def pack_archive(source: str, path: str = DEFAULT_PACK_PATH, block_size: int = PACK_BLOCK_SIZE) -> int:
+    """Converts an archive directory or an archive store file into a pack file. Returns the number of entries packed."""
+    if isdir(source):
+        return write_pack(archive_dir_entries(source), path, block_size)
+
+    with ArchiveStore(source) as archive_store:
+        return write_pack(archive_store.iter_raw(), path, block_size)
+
+
+class ArchivePack:
+    """Read-only view of a pack file with the lookup interface of ArchiveStore.
+
+    The file is memory-mapped and its index is used in place, so opening a pack reads nothing but the header.
+    A lookup decompresses only the block holding the ride, a full scan decompresses each block once, in file order.
+    It can stand in for the store in load_route_summary, and for main.py's store through ARCHIVE_PACK_PATH."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, entry_count, block_count, offset = HEADER.unpack_from(self._map, 0)
+        if magic != PACK_MAGIC:
+            self.close()
+            raise ValueError(f"not an archive pack: {path}")
+
+        self._index = {}
+        for name, dtype in INDEX_COLUMNS:
+            self._index[name] = np.frombuffer(self._map, dtype=dtype, count=entry_count, offset=offset)
+            offset += self._index[name].nbytes
+        self._blocks = {}
+        for name, dtype in BLOCK_COLUMNS:
+            self._blocks[name] = np.frombuffer(self._map, dtype=dtype, count=block_count, offset=offset)
+            offset += self._blocks[name].nbytes
+
+        self._cached_block = (None, b"") #consecutive lookups mostly land in the same block
+
+    def _position(self, ride_id) -> int:
+        """Position of a ride in the index, None when it is not packed."""
+        ride_ids = self._index["ride_id"]
+        position = int(np.searchsorted(ride_ids, int(ride_id)))
+        if position < len(ride_ids) and ride_ids[position] == int(ride_id):
+            return position
+
+        return None
+
+    def _block(self, block: int) -> bytes:
+        cached_block, data = self._cached_block
+        if cached_block != block:
+            offset = int(self._blocks["offset"][block])
+            data = zlib.decompress(self._map[offset:offset + int(self._blocks["length"][block])])
+            self._cached_block = (block, data)
+
+        return data
+
+    def __contains__(self, ride_id) -> bool:
+        return self._position(ride_id) is not None
+
+    def __len__(self) -> int:
+        return len(self._index["ride_id"])
+
+    def ids(self) -> frozenset:
+        """Retrieves the ids of all packed rides."""
+        return frozenset(self._index["ride_id"].tolist())
+
+    def versions(self) -> dict:
+        """Maps every packed ride id to the version of its entry at the time it was packed."""
+        return dict(zip(self._index["ride_id"].tolist(), self._index["version"].tolist()))
+
+    def get_raw(self, ride_id: int) -> str:
+        """Retrieves the serialized API call result of a ride."""
+        position = self._position(ride_id)
+        if position is None:
+            raise KeyError(ride_id)
+
+        start = int(self._index["start"][position])
+        data = self._block(int(self._index["block"][position]))
+        return data[start:start + int(self._index["length"][position])].decode()
+
+    def get(self, ride_id: int) -> dict:
+        """Retrieves the API call result of a ride."""
+        return decode_json(self.get_raw(ride_id))
+
+    def iter_raw(self):
+        """Streams (ride id, version, serialized result) for every entry in id order, reading the file front to back."""
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+        ride_ids, versions = self._index["ride_id"].tolist(), self._index["version"].tolist()
+        blocks, starts, lengths = self._index["block"].tolist(), self._index["start"].tolist(), self._index["length"].tolist()
+        for position, ride_id in enumerate(ride_ids):
+            data = self._block(blocks[position])
+            yield ride_id, versions[position], data[starts[position]:starts[position] + lengths[position]].decode()
+
+    def close(self):
+        self._index = self._blocks = None #views into the map have to be released before it closes
+        self._cached_block = (None, b"")
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs archived API call results into a single memory-mappable file of compressed blocks.")
+    parser.add_argument("source", nargs="?", default=DEFAULT_ARCHIVE_DIR, help="one-file-per-ride archive directory or archive store file")
+    parser.add_argument("pack_path", nargs="?", default=DEFAULT_PACK_PATH)
+    parser.add_argument("--block-size", type=int, default=PACK_BLOCK_SIZE, help="bytes of results per compressed block")
+    args = parser.parse_args()
+
+    count = pack_archive(args.source, args.pack_path, args.block_size)
+    print("Packed", count, "archived results into", args.pack_path)
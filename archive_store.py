@@ -0,0 +1,167 @@
+import argparse
+import json
+import sqlite3
+import threading
+from os import listdir
+from os.path import isdir, join
+from pathlib import Path
+
+try: #orjson decodes API call results several times faster, the standard library is used when it is not installed
+    from orjson import loads as decode_json
+except ImportError:
+    from json import loads as decode_json
+
+DEFAULT_ARCHIVE_DIR = "2023_archive"
+DEFAULT_STORE_PATH = "2023_archive.sqlite"
+ITER_BATCH_SIZE = 1000 #entries read at a time when streaming the whole store
+
+
+class ArchiveStore:
+    """Single-file SQLite store holding the archived API call result of each ride.
+
+    Every entry carries a version taken from a store-wide sequence whenever it is written, letting later stages tell
+    which results changed since they last looked. Versions are never reused, even for entries deleted and written again."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS responses ("
+                                 "ride_id INTEGER PRIMARY KEY, "
+                                 "version INTEGER NOT NULL, "
+                                 "body TEXT NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._connection.execute("INSERT OR IGNORE INTO metadata SELECT 'next_version', COALESCE(MAX(version), 0) + 1 FROM responses")
+        self._connection.commit()
+
+        self._ids = {row[0] for row in self._connection.execute("SELECT ride_id FROM responses")} #kept in memory for constant time existence checks
+
+    def __contains__(self, ride_id) -> bool:
+        return int(ride_id) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def ids(self) -> frozenset:
+        """Retrieves the ids of all archived rides."""
+        return frozenset(self._ids)
+
+    def versions(self) -> dict:
+        """Maps every archived ride id to the version of its entry."""
+        with self._lock:
+            return dict(self._connection.execute("SELECT ride_id, version FROM responses"))
+
+    def get_raw(self, ride_id: int) -> str:
+        """Retrieves the serialized API call result of a ride."""
+        with self._lock:
+            row = self._connection.execute("SELECT body FROM responses WHERE ride_id = ?", (int(ride_id),)).fetchone()
+
+        if row is None:
+            raise KeyError(ride_id)
+
+        return row[0]
+
+    def get(self, ride_id: int) -> dict:
+        """Retrieves the API call result of a ride."""
+        return decode_json(self.get_raw(ride_id))
+
+    def put(self, ride_id: int, result_json: dict):
+        """Archives the API call result of a ride, replacing any existing entry."""
+        self.put_many([(ride_id, result_json)])
+
+    def put_many(self, entries):
+        """Archives several (ride id, API call result) pairs in a single transaction."""
+        rows = [(int(ride_id), json.dumps(result_json, separators=(",", ":"))) for ride_id, result_json in entries]
+        with self._lock:
+            next_version = self._connection.execute("SELECT value FROM metadata WHERE key = 'next_version'").fetchone()[0]
+            self._connection.executemany("INSERT INTO responses (ride_id, version, body) VALUES (?, ?, ?) "
+                                         "ON CONFLICT(ride_id) DO UPDATE SET version = excluded.version, body = excluded.body",
+                                         [(ride_id, next_version + i, body) for i, (ride_id, body) in enumerate(rows)])
+            self._connection.execute("UPDATE metadata SET value = ? WHERE key = 'next_version'", (next_version + len(rows),))
+            self._connection.commit()
+            self._ids.update(ride_id for ride_id, body in rows)
+
+    def delete(self, ride_id: int):
+        """Removes the entry of a ride so its API call is made again."""
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE ride_id = ?", (int(ride_id),))
+            self._connection.commit()
+            self._ids.discard(int(ride_id))
+
+    def iter_raw(self, batch_size: int = ITER_BATCH_SIZE):
+        """Streams (ride id, version, serialized result) for every entry in id order, reading batch_size entries at a time.
+
+        Each batch starts after the last id of the previous one, so the store can be written between batches."""
+        last_id = None
+        while True:
+            with self._lock:
+                rows = self._connection.execute("SELECT ride_id, version, body FROM responses WHERE ? IS NULL OR ride_id > ? "
+                                                "ORDER BY ride_id LIMIT ?", (last_id, last_id, batch_size)).fetchall()
+            if not rows:
+                return
+
+            yield from rows
+            last_id = rows[-1][0]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_raw_entries(store_path: str, ride_ids: list):
+    """Streams (ride id, serialized result) pairs for the given rides through a separate read-only connection.
+
+    Meant for worker processes, which cannot share the connection held by an ArchiveStore."""
+    connection = sqlite3.connect(Path(store_path).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        for start in range(0, len(ride_ids), 500): #stays below SQLite's limit on query parameters
+            batch = [int(ride_id) for ride_id in ride_ids[start:start + 500]]
+            placeholders = ",".join("?" * len(batch))
+            yield from connection.execute(f"SELECT ride_id, body FROM responses WHERE ride_id IN ({placeholders})", batch)
+    finally:
+        connection.close()
+
+
+def import_archive_dir(store: ArchiveStore, archive_dir: str, batch_size: int = 1000) -> int:
+    """Copies every <id>.json file of a legacy archive directory into the store. Returns the number imported."""
+    if not isdir(archive_dir):
+        raise FileNotFoundError(f"archive directory not found: {archive_dir}")
+
+    imported = 0
+    batch = []
+    for file_name in listdir(archive_dir):
+        if not file_name.endswith(".json"):
+            continue
+
+        with open(join(archive_dir, file_name), 'r') as file:
+            batch.append((int(file_name.removesuffix(".json")), json.load(file)))
+
+        if len(batch) >= batch_size:
+            store.put_many(batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        store.put_many(batch)
+        imported += len(batch)
+
+    return imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Imports a directory of archived API call results into a single archive store.")
+    parser.add_argument("archive_dir", nargs="?", default=DEFAULT_ARCHIVE_DIR)
+    parser.add_argument("store_path", nargs="?", default=DEFAULT_STORE_PATH)
+    args = parser.parse_args()
+
+    with ArchiveStore(args.store_path) as archive_store:
+        count = import_archive_dir(archive_store, args.archive_dir)
+    print("Imported", count, "archived results into", args.store_path)
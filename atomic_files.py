@@ -0,0 +1,17 @@
+from contextlib import contextmanager
+from os import getpid, remove, replace
+from os.path import isfile
+
+
+@contextmanager
+def atomic_write(path: str):
+    """Yields a temporary path to write a file to, which then replaces path at once, so a crash cannot leave it half written.
+
+    The temporary file is named after the process, so processes writing the same file do not collide. It is removed when writing fails."""
+    temp_path = f"{path}.{getpid()}.tmp"
+    try:
+        yield temp_path
+        replace(temp_path, path)
+    finally:
+        if isfile(temp_path):
+            remove(temp_path)
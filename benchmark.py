@@ -0,0 +1,181 @@
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from os import chdir, getcwd
+from os.path import join
+import numpy as np
+import pandas as pd
+import main
+from archive_store import ArchiveStore
+from route_summary import ROUTE_SUMMARY_FILE_NAME, load_route_summary
+from ride_times import convert_ride_times
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+REPORT_FILE_NAME = "benchmark_report.json"
+
+RESPONSE_KINDS = ["TRANSIT", "WALKING", "ZERO_RESULTS", "DRIVING"]
+RESPONSE_WEIGHTS = [0.7, 0.15, 0.1, 0.05] #rough mix seen in the 2023 archive
+
+
+def generate_ride_export(ride_count: int, seed: int = 0) -> pd.core.frame.DataFrame:
+    """Creates an EPP-style ride export with rides spread over a year of South Bend pickups and drop offs."""
+    rng = np.random.default_rng(seed)
+    request_times = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, ride_count), unit="min")
+    ride_minutes = rng.integers(5, 60, ride_count)
+    drop_off_times = request_times + pd.to_timedelta(ride_minutes, unit="min")
+
+    def local_dates(times):
+        return [f"{month}/{day}/{year}" for month, day, year in zip(times.month, times.day, times.year)]
+
+    def local_times(times):
+        return [f"{(hour - 1) % 12 + 1}:{minute:02d}{'AM' if hour < 12 else 'PM'}" for hour, minute in zip(times.hour, times.minute)]
+
+    return pd.DataFrame({"Request Date (Local)": local_dates(request_times),
+                         "Request Time (Local)": local_times(request_times),
+                         "Drop-off Date (Local)": local_dates(drop_off_times),
+                         "Drop-off Time (Local)": local_times(drop_off_times),
+                         "Pickup Latitude": rng.uniform(41.60, 41.72, ride_count),
+                         "Pickup Longitude": rng.uniform(-86.35, -86.15, ride_count),
+                         "Drop Off Latitude": rng.uniform(41.60, 41.72, ride_count),
+                         "Drop Off Longitude": rng.uniform(-86.35, -86.15, ride_count),
+                         "Duration (min)": ride_minutes - rng.integers(0, 5, ride_count),
+                         "Total Time (min)": ride_minutes})
+
+
+def generate_step(rng: np.random.Generator, travel_mode: str) -> dict:
+    """Creates a single step of a Directions API leg."""
+    duration = int(rng.integers(60, 1500)) if travel_mode != "WALKING" else int(rng.integers(30, 600))
+    distance = int(duration * (1.4 if travel_mode == "WALKING" else 8))
+    step = {"travel_mode": travel_mode,
+            "distance": {"text": f"{distance / 1609.34:.1f} mi", "value": distance},
+            "duration": {"text": f"{duration // 60} mins", "value": duration},
+            "html_instructions": "Synthetic step"}
+    if travel_mode == "TRANSIT":
+        step["transit_details"] = {"line": {"short_name": str(rng.integers(1, 20))}, "num_stops": int(rng.integers(1, 30))}
+
+    return step
+
+
+def generate_directions_response(rng: np.random.Generator, kind: str, request_time: int) -> dict:
+    """Creates a Directions API response of the given kind: TRANSIT, WALKING, ZERO_RESULTS or DRIVING."""
+    if kind == "ZERO_RESULTS":
+        return {"geocoded_waypoints": [], "routes": [], "status": "ZERO_RESULTS"}
+
+    if kind == "TRANSIT":
+        travel_modes = ["WALKING"]
+        for _ in range(int(rng.integers(1, 4))): #one to three buses, each followed by a walk
+            travel_modes += ["TRANSIT", "WALKING"]
+    elif kind == "WALKING":
+        travel_modes = ["WALKING"] * int(rng.integers(1, 8))
+    else:
+        travel_modes = ["WALKING", "DRIVING"]
+
+    steps = [generate_step(rng, travel_mode) for travel_mode in travel_modes]
+    duration = sum(step["duration"]["value"] for step in steps)
+    leg = {"duration": {"text": f"{duration // 60} mins", "value": duration}, "steps": steps}
+    if kind == "TRANSIT":
+        leg["departure_time"] = {"value": request_time}
+        leg["arrival_time"] = {"value": request_time + duration + int(rng.integers(0, 1800))} #time spent waiting
+
+    return {"geocoded_waypoints": [], "routes": [{"legs": [leg]}], "status": "OK"}
+
+
+def populate_archive(archive_store: ArchiveStore, rides_df: pd.core.frame.DataFrame, seed: int = 0):
+    """Archives a synthetic response for every ride."""
+    rng = np.random.default_rng(seed)
+    kinds = rng.choice(RESPONSE_KINDS, size=len(rides_df), p=RESPONSE_WEIGHTS)
+    entries = [(ride_id, generate_directions_response(rng, kind, int(request_time)))
+               for ride_id, kind, request_time in zip(rides_df["ID"], kinds, rides_df["Request Time"])]
+
+    for start in range(0, len(entries), 10000):
+        archive_store.put_many(entries[start:start + 10000])
+
+
+def time_stage(timings: dict, stage: str, function, *args):
+    """Runs a stage, records its wall-clock time in seconds and returns its result."""
+    start = time.perf_counter()
+    result = function(*args)
+    timings[stage] = time.perf_counter() - start
+
+    return result
+
+
+def benchmark_size(ride_count: int, work_dir: str, seed: int = 0) -> dict:
+    """Times every stage of the pipeline on a synthetic ride export of ride_count rides."""
+    export_path = join(work_dir, f"rides_{ride_count}.csv")
+    generate_ride_export(ride_count, seed).to_csv(export_path, index=False)
+
+    timings = {}
+    export_df = time_stage(timings, "csv_load", lambda: next(main.read_ride_export(export_path, None)))
+
+    ride_times = time_stage(timings, "convert_ride_times", convert_ride_times, export_df, main.TARGET_WEEK)
+    rides_df = main.pool_data(export_df, ride_times)
+
+    archive_store = ArchiveStore(join(work_dir, f"archive_{ride_count}.sqlite"))
+    populate_archive(archive_store, rides_df, seed)
+
+    route_summary = time_stage(timings, "route_summary", load_route_summary, archive_store,
+                               join(work_dir, ROUTE_SUMMARY_FILE_NAME), main.PARSE_WORKERS)
+    transit_duration_df = time_stage(timings, "time_splits", main.add_time_splits, rides_df, route_summary)
+
+    def write_outputs():
+        with main.TimeSplitsWriter() as writer:
+            writer.write(transit_duration_df[main.TIME_SPLIT_COLUMNS])
+
+    previous_dir = getcwd()
+    chdir(work_dir) #outputs are written relative to the working directory
+    try:
+        time_stage(timings, "output_write", write_outputs)
+    finally:
+        chdir(previous_dir)
+    archive_store.close()
+
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def current_commit() -> str:
+    """Identifies the commit being benchmarked so reports can be compared across commits."""
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmarks(sizes: list, repeat: int = 1, seed: int = 0) -> dict:
+    """Benchmarks every size, keeping the fastest of repeat runs for each stage."""
+    report = {"commit": current_commit(),
+              "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+              "python": platform.python_version(),
+              "pandas": pd.__version__,
+              "numpy": np.__version__,
+              "results": {}}
+
+    for ride_count in sizes:
+        best = {}
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as work_dir:
+                timings = benchmark_size(ride_count, work_dir, seed)
+            best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in timings.items()}
+
+        report["results"][str(ride_count)] = best
+        print(ride_count, "rides:", ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in best.items()))
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Times each stage of main.py on synthetic rides and Directions API responses.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numbers of rides to benchmark")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per size, the fastest time of each stage is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=REPORT_FILE_NAME, help="machine-readable JSON report")
+    args = parser.parse_args()
+
+    benchmark_report = run_benchmarks(args.sizes, args.repeat, args.seed)
+    with open(args.output, 'w') as file:
+        json.dump(benchmark_report, file, indent=4)
+    print("Report written to", args.output)
@@ -0,0 +1,223 @@
+import argparse
+import json
+import math
+from os.path import isfile
+import numpy as np
+import pandas as pd
+from atomic_files import atomic_write
+from manifest import hash_file
+from time_splits_io import iter_time_splits
+
+DISTRIBUTIONS_FILE_NAME = "duration_distributions.json"
+MEASURES = ["Transit Duration", "Time Spent - Walking", "Time Spent - Bus", "Time Spent - Waiting"] #minutes
+HISTOGRAM_MINUTES = 1440 #one dense bin per whole minute from 0, the rare longer and negative durations are counted per minute apart
+DISTRIBUTIONS_VERSION = 2 #stored distributions of another version are rebuilt
+SKETCH_ACCURACY = 0.01 #relative error of quantiles read from a sketch
+CHUNK_SIZE = 100000 #rows read at a time
+SUMMARY_QUANTILES = {"Median": 0.5, "P90": 0.9, "P99": 0.99}
+
+
+class MinuteHistogram:
+    """Counts of whole-minute durations, mergeable by adding counts."""
+
+    def __init__(self, counts: list = None, outside: dict = None):
+        self.counts = np.zeros(HISTOGRAM_MINUTES + 1, dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self.outside = outside or {} #minute: count of durations that are negative or over HISTOGRAM_MINUTES
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum()) + sum(self.outside.values())
+
+    def add(self, minutes: np.ndarray):
+        minutes = np.floor(minutes).astype(np.int64)
+        in_range = (minutes >= 0) & (minutes <= HISTOGRAM_MINUTES)
+        self.counts += np.bincount(minutes[in_range], minlength=HISTOGRAM_MINUTES + 1)
+        for minute, count in zip(*(array.tolist() for array in np.unique(minutes[~in_range], return_counts=True))):
+            self.outside[minute] = self.outside.get(minute, 0) + count
+
+    def merge(self, other: "MinuteHistogram"):
+        self.counts += other.counts
+        for minute, count in other.outside.items():
+            self.outside[minute] = self.outside.get(minute, 0) + count
+
+    def values_and_counts(self, max_minutes: int = None) -> tuple:
+        """Durations that occur and how often, in increasing order, optionally only up to max_minutes."""
+        values = np.concatenate([np.arange(HISTOGRAM_MINUTES + 1), np.fromiter(self.outside, dtype=np.int64, count=len(self.outside))])
+        counts = np.concatenate([self.counts, np.fromiter(self.outside.values(), dtype=np.int64, count=len(self.outside))])
+        occurring = (counts > 0) & (values <= (np.inf if max_minutes is None else max_minutes))
+        order = np.argsort(values[occurring], kind="stable")
+        return values[occurring][order], counts[occurring][order]
+
+    def to_dict(self) -> dict:
+        return {"counts": self.counts.tolist(), "outside": self.outside}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MinuteHistogram":
+        #json object keys are always strings, minutes are restored to integers
+        return cls(data["counts"], {int(minute): count for minute, count in data["outside"].items()})
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with relative accuracy, storing counts in logarithmically sized buckets.
+
+    Any quantile is within SKETCH_ACCURACY of a true value of the data, however many values are added or merged."""
+
+    def __init__(self, positive: dict = None, negative: dict = None, zeros: int = 0):
+        self.gamma = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+        self.positive = positive or {} #bucket index: count, bucket i holds values in (gamma^(i-1), gamma^i]
+        self.negative = negative or {} #same buckets for the magnitude of negative values
+        self.zeros = zeros
+
+    @property
+    def count(self) -> int:
+        return self.zeros + sum(self.positive.values()) + sum(self.negative.values())
+
+    def _add_magnitudes(self, buckets: dict, magnitudes: np.ndarray):
+        indices, counts = np.unique(np.ceil(np.log(magnitudes) / math.log(self.gamma)).astype(np.int64), return_counts=True)
+        for index, count in zip(indices.tolist(), counts.tolist()):
+            buckets[index] = buckets.get(index, 0) + count
+
+    def add(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self._add_magnitudes(self.positive, values[values > 0])
+        self._add_magnitudes(self.negative, -values[values < 0])
+        self.zeros += int((values == 0).sum())
+
+    def merge(self, other: "QuantileSketch"):
+        for buckets, other_buckets in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_buckets.items():
+                buckets[index] = buckets.get(index, 0) + count
+        self.zeros += other.zeros
+
+    def _bucket_value(self, index: int) -> float:
+        return 2 * self.gamma ** index / (self.gamma + 1) #midpoint in relative terms of the bucket's bounds
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q (0 to 1), None when the sketch is empty."""
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True): #largest magnitudes are the smallest values
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._bucket_value(index)
+
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._bucket_value(index)
+
+        return self._bucket_value(max(self.positive))
+
+    def to_dict(self) -> dict:
+        return {"positive": self.positive, "negative": self.negative, "zeros": self.zeros}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        #json object keys are always strings, bucket indices are restored to integers
+        return cls({int(index): count for index, count in data["positive"].items()},
+                   {int(index): count for index, count in data["negative"].items()},
+                   data["zeros"])
+
+
+class DurationDistribution:
+    """Minute histogram and quantile sketch of every measure of a time splits file."""
+
+    def __init__(self, histograms: dict = None, sketches: dict = None):
+        self.histograms = histograms or {measure: MinuteHistogram() for measure in MEASURES}
+        self.sketches = sketches or {measure: QuantileSketch() for measure in MEASURES}
+
+    def add(self, df: pd.core.frame.DataFrame):
+        for measure in MEASURES:
+            values = df[measure].dropna().to_numpy()
+            self.histograms[measure].add(values)
+            self.sketches[measure].add(values)
+
+    def merge(self, other: "DurationDistribution"):
+        for measure in MEASURES:
+            self.histograms[measure].merge(other.histograms[measure])
+            self.sketches[measure].merge(other.sketches[measure])
+
+    def to_dict(self) -> dict:
+        return {measure: {"histogram": self.histograms[measure].to_dict(), "sketch": self.sketches[measure].to_dict()} for measure in MEASURES}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DurationDistribution":
+        return cls({measure: MinuteHistogram.from_dict(data[measure]["histogram"]) for measure in MEASURES},
+                   {measure: QuantileSketch.from_dict(data[measure]["sketch"]) for measure in MEASURES})
+
+
+def summarize_file(path: str, chunk_size: int = CHUNK_SIZE) -> DurationDistribution:
+    """Builds the distribution of a time splits file in a single chunked pass, reading only the measure columns."""
+    distribution = DurationDistribution()
+    for chunk in iter_time_splits(path, chunk_size, MEASURES):
+        distribution.add(chunk)
+
+    return distribution
+
+
+def load_distributions(input_file_names: list, path: str = DISTRIBUTIONS_FILE_NAME, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Retrieves the distribution of every input file, keyed by file name.
+
+    Distributions are persisted at path along with a fingerprint of their file, only new or changed files are read,
+    as are files persisted by another DISTRIBUTIONS_VERSION."""
+    stored = {}
+    if isfile(path):
+        with open(path, 'r') as file:
+            stored = json.load(file)
+
+    distributions = {}
+    changed = False
+    for input_file_name in input_file_names:
+        input_hash = hash_file(input_file_name)
+        if stored.get(input_file_name, {}).get("input_hash") == input_hash and stored[input_file_name].get("version") == DISTRIBUTIONS_VERSION:
+            distributions[input_file_name] = DurationDistribution.from_dict(stored[input_file_name]["distribution"])
+            continue
+
+        distributions[input_file_name] = summarize_file(input_file_name, chunk_size)
+        stored[input_file_name] = {"version": DISTRIBUTIONS_VERSION, "input_hash": input_hash, "distribution": distributions[input_file_name].to_dict()}
+        changed = True
+
+    if changed:
+        with atomic_write(path) as temp_path, open(temp_path, 'w') as file:
+            json.dump(stored, file)
+
+    return distributions
+
+
+def combine(distributions) -> DurationDistribution:
+    """Merges several distributions, e.g. every year, into one."""
+    combined = DurationDistribution()
+    for distribution in distributions:
+        combined.merge(distribution)
+
+    return combined
+
+
+def percentile_summary(distributions: dict) -> pd.core.frame.DataFrame:
+    """Count, median, p90 and p99 of every measure, per input file and over all of them."""
+    rows = []
+    for label, distribution in [*distributions.items(), ("All", combine(distributions.values()))]:
+        for measure in MEASURES:
+            sketch = distribution.sketches[measure]
+            rows.append({"Input": label, "Measure": measure, "Count": sketch.count,
+                         **{name: sketch.quantile(q) for name, q in SUMMARY_QUANTILES.items()}})
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarizes the duration distributions of time splits files without loading their rows.")
+    parser.add_argument("inputs", nargs="+", help="time splits files, e.g. one per program year")
+    parser.add_argument("--output", default=DISTRIBUTIONS_FILE_NAME, help="file the distributions are persisted in")
+    args = parser.parse_args()
+
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(percentile_summary(load_distributions(args.inputs, args.output)).to_string(index=False))
@@ -0,0 +1,88 @@
+import re
+import sqlite3
+import threading
+import time
+
+FAILURE_CLASSES = ("bad_coordinates", "driving_directions", "no_route", "request_failed")
+FAILURE_BATCH_SIZE = 100 #records buffered before they are written out
+
+
+def redact_api_key(request_url: str) -> str:
+    """Removes the API key from a request url so it can be stored."""
+    return re.sub(r"([?&]key=)[^&]*", r"\1REDACTED", request_url)
+
+
+class FailureLog:
+    """Queryable SQLite log of rides whose API call did not produce public transit directions.
+
+    Records are buffered and written in batches. Only the latest failure of each class is kept per ride."""
+
+    def __init__(self, path: str, batch_size: int = FAILURE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS failures ("
+                                 "ride_id INTEGER NOT NULL, "
+                                 "failure_class TEXT NOT NULL, "
+                                 "status TEXT, " #API status, or the HTTP status code when the request itself failed
+                                 "recorded_at REAL NOT NULL, " #unix time
+                                 "request_url TEXT, " #API key redacted
+                                 "PRIMARY KEY (ride_id, failure_class))")
+        self._connection.commit()
+
+    def record(self, ride_id: int, failure_class: str, status: str = None, request_url: str = None):
+        """Buffers a failure, writing the buffer out once it holds batch_size records."""
+        if failure_class not in FAILURE_CLASSES:
+            raise ValueError(f"unknown failure class: {failure_class}")
+
+        redacted_url = redact_api_key(request_url) if request_url is not None else None
+        with self._lock:
+            self._buffer.append((int(ride_id), failure_class, status, time.time(), redacted_url))
+            if len(self._buffer) >= self.batch_size:
+                self._flush_buffer()
+
+    def flush(self):
+        """Writes out every buffered record."""
+        with self._lock:
+            self._flush_buffer()
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return
+
+        self._connection.executemany("INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?)", self._buffer)
+        self._connection.commit()
+        self._buffer = []
+
+    def failed_ids(self, failure_classes=None) -> set:
+        """Retrieves the ids of rides with a recorded failure, optionally limited to the given classes."""
+        self.flush()
+        with self._lock:
+            if failure_classes is None:
+                rows = self._connection.execute("SELECT DISTINCT ride_id FROM failures")
+            else:
+                failure_classes = list(failure_classes)
+                placeholders = ",".join("?" * len(failure_classes))
+                rows = self._connection.execute(f"SELECT DISTINCT ride_id FROM failures WHERE failure_class IN ({placeholders})", failure_classes)
+
+            return {row[0] for row in rows}
+
+    def counts(self) -> dict:
+        """Number of rides recorded under each failure class."""
+        self.flush()
+        with self._lock:
+            return dict(self._connection.execute("SELECT failure_class, COUNT(*) FROM failures GROUP BY failure_class"))
+
+    def clear(self, failure_class: str):
+        """Forgets every failure of a class, used when retrying those rides."""
+        self.flush()
+        with self._lock:
+            self._connection.execute("DELETE FROM failures WHERE failure_class = ?", (failure_class,))
+            self._connection.commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._connection.close()
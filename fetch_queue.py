@@ -0,0 +1,119 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+
+RETRYABLE_STATUSES = ("UNKNOWN_ERROR", "OVER_QUERY_LIMIT") #API statuses worth asking again, the API itself says they may succeed later
+RETRYABLE_HTTP_STATUSES = (408, 429) #HTTP statuses worth asking again besides every 5xx, other 4xx errors do not go away
+MAX_ATTEMPTS = 5 #calls made for a ride before it is given up on
+BACKOFF_BASE = 2 #seconds, the longest wait before the second attempt, doubling with every further attempt
+BACKOFF_CAP = 300 #seconds, longest wait between attempts
+
+
+class FetchQueue:
+    """Persistent SQLite queue of the API calls still to be made, surviving interruptions of a run.
+
+    Each item is a call for one ride, along with the rides sharing its result, an attempt count and the time it is
+    next due. Items leave the queue once their result is archived or they run out of attempts, so a run that stops
+    part way resumes with exactly the calls it had not finished. Retries wait an exponentially growing, randomly
+    jittered time, which keeps a burst of failures from being retried in lockstep."""
+
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS, backoff_base: float = BACKOFF_BASE, backoff_cap: float = BACKOFF_CAP):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._leased = set() #ids of items handed out and not yet completed or retried, only held in memory
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS pending ("
+                                 "ride_id INTEGER PRIMARY KEY, "
+                                 "request TEXT NOT NULL, " #json of the ride's endpoints and request time
+                                 "shared_ids TEXT NOT NULL, " #json list of rides archived with the same result
+                                 "attempts INTEGER NOT NULL DEFAULT 0, "
+                                 "next_attempt_at REAL NOT NULL DEFAULT 0, " #unix time
+                                 "last_status TEXT)") #API status, HTTP status code or error of the latest failed attempt
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pending_due ON pending (next_attempt_at)")
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+    def enqueue(self, calls):
+        """Adds (ride, shared ids) calls to the queue. Rides already queued keep their attempt count and due time."""
+        rows = [(ride["ID"], json.dumps({"Start": ride["Start"], "End": ride["End"], "Request Time": ride["Request Time"]}), json.dumps(shared_ids))
+                for ride, shared_ids in calls]
+        with self._lock:
+            self._connection.executemany("INSERT INTO pending (ride_id, request, shared_ids) VALUES (?, ?, ?) "
+                                         "ON CONFLICT(ride_id) DO UPDATE SET request = excluded.request, shared_ids = excluded.shared_ids", rows)
+            self._connection.commit()
+
+    def claim_due(self, limit: int) -> list:
+        """Hands out up to limit (ride, shared ids, attempts) calls that are due, earliest first, skipping those already handed out."""
+        with self._lock:
+            rows = self._connection.execute("SELECT ride_id, request, shared_ids, attempts FROM pending WHERE next_attempt_at <= ? "
+                                            "ORDER BY next_attempt_at, ride_id LIMIT ?", (time.time(), limit + len(self._leased))).fetchall()
+            claimed = []
+            for ride_id, request, shared_ids, attempts in rows:
+                if ride_id in self._leased or len(claimed) >= limit:
+                    continue
+
+                self._leased.add(ride_id)
+                ride = json.loads(request)
+                claimed.append(({"ID": ride_id, "Start": tuple(ride["Start"]), "End": tuple(ride["End"]), "Request Time": ride["Request Time"]},
+                                json.loads(shared_ids), attempts))
+
+            return claimed
+
+    def seconds_until_due(self) -> float:
+        """Time until the next call not handed out is due, 0 when one is due now and None when there is none."""
+        with self._lock:
+            rows = self._connection.execute("SELECT ride_id, next_attempt_at FROM pending ORDER BY next_attempt_at LIMIT ?",
+                                            (len(self._leased) + 1,)).fetchall()
+
+        for ride_id, next_attempt_at in rows:
+            if ride_id not in self._leased:
+                return max(0.0, next_attempt_at - time.time())
+
+        return None
+
+    def complete(self, ride_id: int):
+        """Removes a call whose result was archived, or that failed for good."""
+        with self._lock:
+            self._connection.execute("DELETE FROM pending WHERE ride_id = ?", (int(ride_id),))
+            self._connection.commit()
+            self._leased.discard(int(ride_id))
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds to wait after the given number of failed attempts, drawn uniformly up to an exponentially growing bound."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** (attempts - 1)))
+
+    def retry(self, ride_id: int, status: str) -> bool:
+        """Counts a failed attempt and schedules the call again after a backoff.
+
+        Returns False and removes the call instead once it has been attempted max_attempts times."""
+        with self._lock:
+            attempts = self._connection.execute("SELECT attempts FROM pending WHERE ride_id = ?", (int(ride_id),)).fetchone()[0] + 1
+            exhausted = attempts >= self.max_attempts
+            if exhausted:
+                self._connection.execute("DELETE FROM pending WHERE ride_id = ?", (int(ride_id),))
+            else:
+                self._connection.execute("UPDATE pending SET attempts = ?, next_attempt_at = ?, last_status = ? WHERE ride_id = ?",
+                                         (attempts, time.time() + self.backoff(attempts), status, int(ride_id)))
+            self._connection.commit()
+            self._leased.discard(int(ride_id))
+
+        return not exhausted
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
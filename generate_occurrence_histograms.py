@@ -1,35 +1,32 @@
 import seaborn as sns
-import pandas as pd
 import matplotlib.pyplot as plt
+from duration_distributions import DISTRIBUTIONS_FILE_NAME, load_distributions, combine
 
-INPUT_FILE_NAME_2023 = "2023_data.csv"
-INPUT_FILE_NAME_2024 = "2024_data.csv"
+INPUT_FILE_NAME_2023 = "2023_time_splits.parquet" #time splits output of main.py for each program year, csv also works
+INPUT_FILE_NAME_2024 = "2024_time_splits.parquet"
 OUTPUT_FILE_NAME = "output file name"
+TRIM_THRESHOLD = 200 #minutes, longer estimates are left out of the trimmed plot
 
-if __name__ == "__main__":
-    # Data Input
-    dataDF2023 = pd.read_csv(INPUT_FILE_NAME_2023)
-    dataDF2024 = pd.read_csv(INPUT_FILE_NAME_2024)
 
-    # Data Processing
-    dataDFBoth = pd.concat([dataDF2023, dataDF2024])
-    dataDFBothBelow200 = dataDFBoth[dataDFBoth["Transit Duration"] <= 200]
+def render_histogram(input_file_names: list, output_file_name: str, trim_threshold: int = None, distributions_file_name: str = DISTRIBUTIONS_FILE_NAME):
+    """Draws the distribution of public transit estimates over every input file, optionally without estimates above trim_threshold."""
+    # Data Input
+    # per minute counts of every file are persisted, so only new or changed files are read, one chunk at a time
+    distributions = load_distributions(input_file_names, distributions_file_name)
+    histogram = combine(distributions.values()).histograms["Transit Duration"]
+    durations, occurrences = histogram.values_and_counts(trim_threshold)
 
-    #Plot Creation (All Data)
+    # Plot Creation
+    plt.figure()
     sns.set_style("whitegrid")
-    plt.title("Distribution - Public Transportation Estimates (All)", fontsize=14)
+    plt.title("Distribution - Public Transportation Estimates (" + ("All" if trim_threshold is None else "Trimmed") + ")", fontsize=14)
     plt.ylabel("Occurrences", fontsize=12)
     plt.xlabel("Duration (mins)", fontsize=12)
 
-    sns.histplot(data=dataDFBoth["Transit Duration"], bins=16)
-    plt.savefig(OUTPUT_FILE_NAME + "(All)" + ".png")
-    plt.clf()
+    sns.histplot(x=durations, weights=occurrences, bins=16)
+    plt.savefig(output_file_name)
 
-    # Plot Creation (Tail Removed)
-    plt.title("Distribution - Public Transportation Estimates (Trimmed)", fontsize=14)
-    plt.ylabel("Occurrences", fontsize=12)
-    plt.xlabel("Duration (mins)", fontsize=12)
-    sns.set_style("whitegrid")
 
-    sns.histplot(data=dataDFBothBelow200["Transit Duration"], bins=16)
-    #plt.savefig(OUTPUT_FILE_NAME + "(Trimmed)" + ".png")
+if __name__ == "__main__":
+    render_histogram([INPUT_FILE_NAME_2023, INPUT_FILE_NAME_2024], OUTPUT_FILE_NAME + "(All)" + ".png")
+    render_histogram([INPUT_FILE_NAME_2023, INPUT_FILE_NAME_2024], OUTPUT_FILE_NAME + "(Trimmed)" + ".png", TRIM_THRESHOLD)
@@ -0,0 +1,336 @@
+import argparse
+import json
+import zipfile
+from os.path import isdir, join
+import numpy as np
+import pandas as pd
+from ride_times import DATA_TIMEZONE
+
+WALKING_SPEED = 1.3 #meters per second
+WALKING_DETOUR = 1.3 #meters walked along streets per meter of straight-line distance
+MAX_ACCESS_WALK = 1200 #meters walked to the first stop and from the last stop
+MAX_TRANSFER_WALK = 400 #meters walked between stops when transferring
+MAX_WALKING_ROUTE = 3000 #meters, longer trips without a transit route get no route at all
+MAX_TRANSFERS = 3
+EARTH_RADIUS = 6371000 #meters
+UNREACHED = np.iinfo(np.int64).max
+
+
+def read_feed_table(feed_path: str, table: str, required: bool = True) -> pd.core.frame.DataFrame:
+    """Reads a table of a GTFS feed, either an unzipped directory or the zip file itself."""
+    file_name = table + ".txt"
+    if isdir(feed_path):
+        try:
+            return pd.read_csv(join(feed_path, file_name), dtype=str, keep_default_na=False)
+        except FileNotFoundError:
+            if required:
+                raise
+            return None
+
+    with zipfile.ZipFile(feed_path) as feed:
+        if file_name not in feed.namelist():
+            if required:
+                raise FileNotFoundError(f"{file_name} missing from GTFS feed {feed_path}")
+            return None
+
+        with feed.open(file_name) as file:
+            return pd.read_csv(file, dtype=str, keep_default_na=False)
+
+
+def parse_gtfs_times(column: pd.core.series.Series) -> np.ndarray:
+    """Converts HH:MM:SS times into seconds after the start of the service day. Hours past 23 are trips running past midnight."""
+    parts = column.str.strip().str.split(":", expand=True).astype("int64")
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).to_numpy()
+
+
+def haversine(latitude, longitude, latitudes, longitudes) -> np.ndarray:
+    """Straight-line distance in meters between a point and each of an array of points."""
+    latitude, longitude, latitudes, longitudes = map(np.radians, (latitude, longitude, latitudes, longitudes))
+    a = np.sin((latitudes - latitude) / 2) ** 2 + np.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def walking_step(meters: float, seconds: int) -> dict:
+    return {"travel_mode": "WALKING",
+            "distance": {"text": f"{meters / 1609.34:.1f} mi", "value": int(round(meters))},
+            "duration": {"text": f"{seconds // 60} mins", "value": seconds}}
+
+
+class TransitPattern:
+    """Trips of a route that serve the same sequence of stops, with their stop times in seconds of the service day."""
+
+    def __init__(self, route_name: str, stops: np.ndarray, trip_ids: list, service_ids: np.ndarray, departures: np.ndarray, arrivals: np.ndarray):
+        self.route_name = route_name
+        self.stops = stops #stop indices in the order they are served
+        self.trip_ids = trip_ids
+        self.service_ids = service_ids #service id of each trip
+        self.departures = departures #trips x stops
+        self.arrivals = arrivals
+
+
+class TransitRouter:
+    """Answers earliest-arrival public transit queries over a GTFS feed in-process, using RAPTOR rounds.
+
+    Routes are returned in the Directions API response format, so they can be archived and summarized like API results.
+    Each round allows one more vehicle: stops are scanned along every pattern serving a stop improved in the previous
+    round, then short walking transfers are relaxed. Walks are straight-line distances scaled by WALKING_DETOUR."""
+
+    def __init__(self, feed_path: str):
+        agency = read_feed_table(feed_path, "agency", required=False)
+        self.timezone = agency["agency_timezone"].iloc[0] if agency is not None and len(agency) > 0 else DATA_TIMEZONE
+
+        stops = read_feed_table(feed_path, "stops")
+        self.stop_ids = stops["stop_id"].to_numpy()
+        self.stop_names = stops["stop_name"].to_numpy() if "stop_name" in stops else self.stop_ids
+        self.stop_latitudes = stops["stop_lat"].astype("float64").to_numpy()
+        self.stop_longitudes = stops["stop_lon"].astype("float64").to_numpy()
+
+        self.calendar = read_feed_table(feed_path, "calendar", required=False)
+        self.calendar_dates = read_feed_table(feed_path, "calendar_dates", required=False)
+        if self.calendar is None and self.calendar_dates is None:
+            raise FileNotFoundError(f"GTFS feed {feed_path} holds neither calendar.txt nor calendar_dates.txt")
+
+        self.patterns = self._build_patterns(feed_path, pd.Series(np.arange(len(stops)), index=self.stop_ids))
+        self.stop_patterns = [[] for _ in range(len(stops))] #(pattern index, position) of every visit to each stop
+        for pattern_index, pattern in enumerate(self.patterns):
+            for position, stop in enumerate(pattern.stops):
+                self.stop_patterns[stop].append((pattern_index, position))
+
+        self.transfers = self._build_transfers()
+        self._timetables = {}
+
+    def _build_patterns(self, feed_path: str, stop_index: pd.core.series.Series) -> list:
+        routes = read_feed_table(feed_path, "routes")
+        names = routes["route_short_name"] if "route_short_name" in routes else routes["route_id"]
+        if "route_long_name" in routes:
+            names = names.where(names != "", routes["route_long_name"])
+        route_names = dict(zip(routes["route_id"], names))
+        trips = read_feed_table(feed_path, "trips")
+        stop_times = read_feed_table(feed_path, "stop_times")
+
+        stop_times["stop_sequence"] = stop_times["stop_sequence"].astype("int64")
+        stop_times = stop_times.sort_values(["trip_id", "stop_sequence"])
+        stop_times["stop"] = stop_index.loc[stop_times["stop_id"]].to_numpy()
+        stop_times["arrival"] = parse_gtfs_times(stop_times["arrival_time"].where(stop_times["arrival_time"] != "", stop_times["departure_time"]))
+        stop_times["departure"] = parse_gtfs_times(stop_times["departure_time"].where(stop_times["departure_time"] != "", stop_times["arrival_time"]))
+
+        trip_routes = dict(zip(trips["trip_id"], trips["route_id"]))
+        trip_services = dict(zip(trips["trip_id"], trips["service_id"]))
+        grouped_trips = {}
+        for trip_id, trip_stop_times in stop_times.groupby("trip_id", sort=False):
+            key = (trip_routes[trip_id], tuple(trip_stop_times["stop"]))
+            grouped_trips.setdefault(key, []).append((trip_id, trip_stop_times["departure"].to_numpy(), trip_stop_times["arrival"].to_numpy()))
+
+        patterns = []
+        for (route_id, pattern_stops), pattern_trips in grouped_trips.items():
+            pattern_trips.sort(key=lambda trip: trip[1][0])
+            patterns.append(TransitPattern(route_names.get(route_id, route_id), np.array(pattern_stops),
+                                           [trip[0] for trip in pattern_trips],
+                                           np.array([trip_services[trip[0]] for trip in pattern_trips]),
+                                           np.vstack([trip[1] for trip in pattern_trips]),
+                                           np.vstack([trip[2] for trip in pattern_trips])))
+
+        return patterns
+
+    def _build_transfers(self) -> list:
+        """Stops within MAX_TRANSFER_WALK of each stop, as (stop, meters walked) pairs."""
+        transfers = []
+        for stop in range(len(self.stop_ids)):
+            meters = haversine(self.stop_latitudes[stop], self.stop_longitudes[stop], self.stop_latitudes, self.stop_longitudes) * WALKING_DETOUR
+            nearby = np.flatnonzero(meters <= MAX_TRANSFER_WALK)
+            transfers.append([(int(other), float(meters[other])) for other in nearby if other != stop])
+
+        return transfers
+
+    def active_services(self, date: pd.Timestamp) -> set:
+        """Service ids running on a date, from calendar.txt and the exceptions in calendar_dates.txt."""
+        day = date.strftime("%Y%m%d")
+        services = set()
+        if self.calendar is not None:
+            weekday = date.day_name().lower()
+            running = (self.calendar["start_date"] <= day) & (self.calendar["end_date"] >= day) & (self.calendar[weekday] == "1")
+            services = set(self.calendar.loc[running, "service_id"])
+
+        if self.calendar_dates is not None:
+            exceptions = self.calendar_dates[self.calendar_dates["date"] == day]
+            services |= set(exceptions.loc[exceptions["exception_type"] == "1", "service_id"])
+            services -= set(exceptions.loc[exceptions["exception_type"] == "2", "service_id"])
+
+        return services
+
+    def service_day_start(self, date: pd.Timestamp) -> int:
+        """Unix time GTFS times of a service day count from: noon minus twelve hours, which differs from midnight on DST days."""
+        noon = pd.Timestamp(date.year, date.month, date.day, 12).tz_localize(self.timezone)
+        return int(noon.timestamp()) - 12 * 3600
+
+    def timetable(self, date: pd.Timestamp) -> list:
+        """Unix departure and arrival times of every trip running on a service date, per pattern. Cached per date.
+
+        Trips of the previous service day still running after midnight are included, as are the trips of the next
+        service day, so late requests are routed onto the first trips of the next morning."""
+        if date in self._timetables:
+            return self._timetables[date]
+
+        days = [(self.active_services(day), self.service_day_start(day)) for day in (date - pd.Timedelta(days=1), date, date + pd.Timedelta(days=1))]
+        day_start = self.service_day_start(date)
+
+        timetables = []
+        for pattern in self.patterns:
+            departures, arrivals, trips = [], [], []
+            for services, start in days:
+                running = np.isin(pattern.service_ids, list(services))
+                if start < day_start: #only trips of the previous day that are still running today
+                    running &= pattern.arrivals[:, -1] + start >= day_start
+                departures.append(pattern.departures[running] + start)
+                arrivals.append(pattern.arrivals[running] + start)
+                trips += [trip_id for trip_id, keep in zip(pattern.trip_ids, running) if keep]
+
+            departures, arrivals = np.vstack(departures), np.vstack(arrivals)
+            order = np.argsort(departures[:, 0], kind="stable")
+            timetables.append((departures[order], arrivals[order], [trips[row] for row in order]))
+
+        self._timetables[date] = timetables
+        return timetables
+
+    def route(self, start: tuple, end: tuple, departure_time: int) -> dict:
+        """Finds the earliest-arriving public transit route between two coordinates, leaving at a unix time.
+
+        Walking the whole way is returned instead when it arrives first, or when there is no transit route and the
+        trip is short enough to walk. Otherwise the response status is ZERO_RESULTS."""
+        date = pd.Timestamp(departure_time, unit="s", tz="UTC").tz_convert(self.timezone).tz_localize(None).normalize()
+        timetables = self.timetable(date)
+
+        access_meters = haversine(start[0], start[1], self.stop_latitudes, self.stop_longitudes) * WALKING_DETOUR
+        egress_meters = haversine(end[0], end[1], self.stop_latitudes, self.stop_longitudes) * WALKING_DETOUR
+        egress_stops = np.flatnonzero(egress_meters <= MAX_ACCESS_WALK)
+        direct_meters = float(haversine(start[0], start[1], np.array([end[0]]), np.array([end[1]]))[0]) * WALKING_DETOUR
+
+        best = np.full(len(self.stop_ids), UNREACHED, dtype=np.int64)
+        arrivals = best.copy()
+        parents = [{}]
+        for stop in np.flatnonzero(access_meters <= MAX_ACCESS_WALK):
+            arrivals[stop] = best[stop] = departure_time + int(access_meters[stop] / WALKING_SPEED)
+            parents[0][int(stop)] = ("access", float(access_meters[stop]))
+        marked = set(parents[0])
+        rounds = [arrivals]
+        target_arrival, target = UNREACHED, None
+
+        for round_number in range(1, MAX_TRANSFERS + 2):
+            previous = rounds[-1]
+            arrivals = previous.copy()
+            parents.append({})
+            queue = {}
+            for stop in marked:
+                for pattern_index, position in self.stop_patterns[stop]:
+                    queue[pattern_index] = min(position, queue.get(pattern_index, position))
+
+            improved = set()
+            for pattern_index, first_position in queue.items():
+                departures, trip_arrivals, _ = timetables[pattern_index]
+                if len(departures) == 0:
+                    continue
+
+                pattern_stops = self.patterns[pattern_index].stops
+                trip, boarded_at = None, None
+                for position in range(first_position, len(pattern_stops)):
+                    stop = pattern_stops[position]
+                    if trip is not None:
+                        arrival = trip_arrivals[trip, position]
+                        if arrival < min(best[stop], target_arrival):
+                            arrivals[stop] = best[stop] = arrival
+                            parents[round_number][stop] = ("transit", pattern_index, trip, boarded_at, position)
+                            improved.add(stop)
+
+                    if previous[stop] != UNREACHED and (trip is None or previous[stop] <= departures[trip, position]):
+                        catchable = np.flatnonzero(departures[:, position] >= previous[stop])
+                        if len(catchable) > 0:
+                            earliest = catchable[np.argmin(departures[catchable, position])]
+                            if trip is None or departures[earliest, position] < departures[trip, position]:
+                                trip, boarded_at = earliest, position
+
+            for stop in list(improved): #a single walk after each vehicle, walks are not chained
+                for other, meters in self.transfers[stop]:
+                    arrival = arrivals[stop] + int(meters / WALKING_SPEED)
+                    if arrival < min(best[other], target_arrival):
+                        arrivals[other] = best[other] = arrival
+                        parents[round_number][other] = ("walk", stop, meters)
+                        improved.add(other)
+
+            for stop in egress_stops:
+                if stop in improved:
+                    arrival = arrivals[stop] + int(egress_meters[stop] / WALKING_SPEED)
+                    if arrival < target_arrival:
+                        target_arrival, target = arrival, (round_number, int(stop))
+
+            rounds.append(arrivals)
+            marked = improved
+            if not marked:
+                break
+
+        walking_arrival = departure_time + int(direct_meters / WALKING_SPEED)
+        if target is None or walking_arrival <= target_arrival:
+            if target is None and direct_meters > MAX_WALKING_ROUTE:
+                return {"geocoded_waypoints": [], "routes": [], "status": "ZERO_RESULTS"}
+
+            leg = {"duration": {"value": walking_arrival - departure_time}, "steps": [walking_step(direct_meters, walking_arrival - departure_time)]}
+            return {"geocoded_waypoints": [], "routes": [{"legs": [leg]}], "status": "OK"}
+
+        steps = self._reconstruct(parents, target, timetables, float(egress_meters[target[1]]))
+        leg = {"departure_time": {"value": departure_time},
+               "arrival_time": {"value": int(target_arrival)},
+               "duration": {"value": int(target_arrival) - departure_time},
+               "steps": steps}
+        return {"geocoded_waypoints": [], "routes": [{"legs": [leg]}], "status": "OK"}
+
+    def _reconstruct(self, parents: list, target: tuple, timetables: list, egress_meters: float) -> list:
+        """Walks the round labels back from the stop the destination was reached from, building Directions API steps."""
+        round_number, stop = target
+        steps = [walking_step(egress_meters, int(egress_meters / WALKING_SPEED))]
+        while True:
+            while stop not in parents[round_number]: #label carried over unchanged from an earlier round
+                round_number -= 1
+
+            parent = parents[round_number][stop]
+            if parent[0] == "access":
+                steps.append(walking_step(parent[1], int(parent[1] / WALKING_SPEED)))
+                break
+
+            if parent[0] == "walk":
+                steps.append(walking_step(parent[2], int(parent[2] / WALKING_SPEED)))
+                stop = parent[1]
+                continue
+
+            _, pattern_index, trip, boarded_at, alighted_at = parent
+            pattern = self.patterns[pattern_index]
+            departures, arrivals, trip_ids = timetables[pattern_index]
+            visited = pattern.stops[boarded_at:alighted_at + 1]
+            meters = haversine(self.stop_latitudes[visited[:-1]], self.stop_longitudes[visited[:-1]],
+                               self.stop_latitudes[visited[1:]], self.stop_longitudes[visited[1:]]).sum()
+            seconds = int(arrivals[trip, alighted_at] - departures[trip, boarded_at])
+            steps.append({"travel_mode": "TRANSIT",
+                          "distance": {"text": f"{meters / 1609.34:.1f} mi", "value": int(round(meters))},
+                          "duration": {"text": f"{seconds // 60} mins", "value": seconds},
+                          "transit_details": {"line": {"short_name": pattern.route_name},
+                                              "trip_id": trip_ids[trip],
+                                              "num_stops": alighted_at - boarded_at,
+                                              "departure_stop": {"name": self.stop_names[visited[0]]},
+                                              "arrival_stop": {"name": self.stop_names[visited[-1]]},
+                                              "departure_time": {"value": int(departures[trip, boarded_at])},
+                                              "arrival_time": {"value": int(arrivals[trip, alighted_at])}}})
+            stop = int(visited[0])
+            round_number -= 1
+
+        return [step for step in reversed(steps) if step["duration"]["value"] > 0 or step["travel_mode"] == "TRANSIT"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finds the earliest-arriving public transit route between two points with a GTFS feed.")
+    parser.add_argument("feed", help="GTFS feed, zip file or unzipped directory")
+    parser.add_argument("start", help="latitude,longitude")
+    parser.add_argument("end", help="latitude,longitude")
+    parser.add_argument("departure", help=f"local departure time, e.g. '2023-03-19 14:16', in the feed's timezone")
+    args = parser.parse_args()
+
+    router = TransitRouter(args.feed)
+    departure = int(pd.Timestamp(args.departure).tz_localize(router.timezone).timestamp())
+    print(json.dumps(router.route(tuple(map(float, args.start.split(","))), tuple(map(float, args.end.split(","))), departure), indent=4))
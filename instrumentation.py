@@ -0,0 +1,121 @@
+import cProfile
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+_EXHAUSTED = object()
+LATENCY_BUCKETS = [0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10] #upper bounds in seconds, slower observations land in a final overflow bucket
+
+
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: list = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}" for bound in self.buckets] + [f">{self.buckets[-1]}"]
+        return {"count": self.count,
+                "mean_seconds": self.total / self.count if self.count else None,
+                "max_seconds": self.maximum,
+                "buckets": dict(zip(labels, self.counts))}
+
+
+class Metrics:
+    """Collects stage timers, counters and latency histograms over a run. Safe to update from worker threads."""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.histograms = {}
+        self.profiled_stages = set() #stages run under cProfile, their stats are dumped to <stage>.prof
+        self._profilers = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the enclosed block, accumulating wall-clock and CPU seconds when the same stage runs several times."""
+        profiler = self._profilers.setdefault(name, cProfile.Profile()) if name in self.profiled_stages else None
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(f"{name}.prof") #stats accumulate over every run of the stage
+
+            wall_seconds = time.perf_counter() - wall_start
+            cpu_seconds = time.process_time() - cpu_start
+            with self._lock:
+                totals = self.stages.setdefault(name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0})
+                totals["calls"] += 1
+                totals["wall_seconds"] += wall_seconds
+                totals["cpu_seconds"] += cpu_seconds
+
+    def profile(self, name: str, function):
+        """Wraps a function so every call is timed, and profiled when name is in profiled_stages, as stage name."""
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    def timed_iter(self, name: str, iterable):
+        """Yields from iterable, timing the production of each item as stage name. Useful for chunked readers."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, _EXHAUSTED)
+            if item is _EXHAUSTED:
+                return
+
+            yield item
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, seconds: float):
+        """Records a duration in the latency histogram called name."""
+        with self._lock:
+            self.histograms.setdefault(name, LatencyHistogram()).observe(seconds)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+                    "wall_seconds": time.time() - self.started,
+                    "stages": {name: dict(totals) for name, totals in self.stages.items()},
+                    "counters": dict(self.counters),
+                    "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()}}
+
+    def write(self, path: str):
+        """Writes the collected metrics as JSON."""
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+    def reset(self):
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+
+METRICS = Metrics() #shared by every stage of the pipeline
@@ -1,23 +1,70 @@
 import requests
 import pandas as pd
 import time
-import datetime
-import json
-from os import getcwd, mkdir, listdir
-from os.path import isdir
-
-OUTPUT_FILE_NAME = "time_splits.csv"
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from os import getcwd
+from os.path import join, isfile
+from archive_store import ArchiveStore
+from archive_pack import ArchivePack
+from instrumentation import METRICS
+from failure_log import FailureLog
+from fetch_queue import RETRYABLE_STATUSES, RETRYABLE_HTTP_STATUSES, FetchQueue
+from time_splits_io import PARQUET_AVAILABLE, TIME_SPLIT_DTYPES, TimeSplitsFileWriter, iter_time_splits
+from manifest import MANIFEST_FILE_NAME, empty_manifest, load_manifest, save_manifest, hash_file, hash_rides, find_new_or_changed_rides, find_removed_rides, find_changed_archive_entries
+from route_summary import ROUTE_SUMMARY_FILE_NAME, load_route_summary, has_travel_mode
+from ride_times import DATA_TIMEZONE, convert_ride_times, ride_share_times
+from gtfs_router import WALKING_SPEED, WALKING_DETOUR, TransitRouter, haversine, walking_step
+from ride_comparison import COMPARISON_FILE_NAME, COMPARISON_COLUMNS, COMPARISON_DTYPES, compare_rides
+from aggregate_cube import CUBE_FILE_NAME, CUBE_BLOCK_SIZE, empty_cube, load_cube, save_cube, aggregate_cells, replace_blocks
+
+OUTPUT_FILE_NAME = "time_splits.parquet" if PARQUET_AVAILABLE else "time_splits.csv" #typed columnar output, csv without pyarrow
+PER_MODE_FILE_PREFIX = "time_splits.csv"
+WRITE_PER_MODE_CSVS = False #set to true to also write the Walking, Public Transit and Waiting csv files
 RIDES_FILE_PATH = "epp_data.csv"
 
-ERRORS_FILE_NAME = "errors.txt"
+ERRORS_FILE_NAME = "errors.sqlite" #failure log, query the failures table or use failure_log.FailureLog
 API_KEY_FILE_NAME = "api-key.txt"
-ARCHIVE_DIR = "2023_archive"
+ARCHIVE_DIR = "2023_archive" #legacy one-file-per-ride archive, import it into the store with archive_store.py
+ARCHIVE_STORE_PATH = "2023_archive.sqlite"
+ARCHIVE_PACK_PATH = None #pack of the archive made with archive_pack.py, read in place of ARCHIVE_STORE_PATH when set, fetching needs the store
+API_BASE_URL = "https://maps.googleapis.com/maps/api/directions/"
+ROUTER = "google" #"google" calls the Directions API, "gtfs" routes rides in-process over GTFS_FEED_PATH without an API key
+GTFS_FEED_PATH = "transpo_gtfs.zip" #zip file or unzipped directory, keep its results in their own ARCHIVE_STORE_PATH
 API_CALL_RATE = 25 #per second
+API_CALL_BURST = 1 #number of calls the rate limiter allows back to back before spacing them out
+CONCURRENT_FETCH = True #keeps several API calls in flight at once, set to false to make calls one at a time
+FETCH_WORKERS = 16 #maximum number of API calls in flight when fetching concurrently
+FETCH_QUEUE_FILE_NAME = "fetch_queue.sqlite" #API calls still to be made, an interrupted run picks up where it stopped
+FETCH_MAX_ATTEMPTS = 5 #calls for a ride before it is logged as a failed request, timeouts and retryable statuses are tried again
+FETCH_TIMEOUT = 30 #seconds a call may take before it counts as a failed attempt
+STREAMING_CHUNK_SIZE = 50000 #rides read from the export at a time, None reads the whole export at once
+PARSE_WORKERS = None #worker processes used to parse archived results, None uses every core and 1 parses in this process
+PRESCREEN_WALKING_DISTANCE = 400 #meters in a straight line, shorter rides get a local walking estimate instead of a call, 0 disables
+DEDUPLICATE_QUERIES = True #rides making an identical API call share a single call and its archived result
+QUERY_COORD_PRECISION = 4 #decimal places coordinates are rounded to when matching identical API calls, ~11 meters
+METRICS_FILE_NAME = "run_metrics.json" #stage timers, counters and API latencies of the latest run
+PROFILED_STAGES = set() #stages to run under cProfile, e.g. {"route_summary"}, stats are written to <stage>.prof
+SKIPPED_FAILURE_CLASSES = {"bad_coordinates"} #rides with a recorded failure of these classes are not fetched again
+RETRY_FAILURE_CLASS = None #set to a failure class, e.g. "no_route", to drop those archived results and fetch the rides again
 NEW_DATA = False #set this to true the first time the script is run to create an archive of API call results
-
-DATA_TZ = -5 #offset relative to UTC in hours, do not change this
-LOCAL_TZ = -6 #necessary as mktime utilizes system time zone for conversion to epoch time, set this to the UTC offset of your timezone
-TARGET_WEEK = "2/13/2025"
+FULL_REBUILD = False #set this to true to ignore the manifest of the previous run and reprocess every ride
+
+TARGET_WEEK = "2/13/2025" #request times are moved into this week for the API, times are read in ride_times.DATA_TIMEZONE
+                          #with the gtfs router set this to None to route rides on their recorded dates, the feed must cover them
+
+COORDINATE_COLUMNS = ["Pickup Latitude", "Pickup Longitude", "Drop Off Latitude", "Drop Off Longitude"]
+RIDE_EXPORT_DTYPES = {"Request Date (Local)": "string", #only these columns of the ride export are read
+                      "Request Time (Local)": "string",
+                      "Drop-off Date (Local)": "string",
+                      "Drop-off Time (Local)": "string",
+                      "Pickup Latitude": "float64",
+                      "Pickup Longitude": "float64",
+                      "Drop Off Latitude": "float64",
+                      "Drop Off Longitude": "float64",
+                      "Duration (min)": "float64"} #time spent in the rideshare car, used by the aggregate cube
+TIME_SPLIT_COLUMNS = list(TIME_SPLIT_DTYPES)
 
 def retrieve_api_key(file_name: str) -> str:
     """Retrieves the contents of the specified file."""
@@ -36,7 +83,7 @@ def construct_request(ride_data: dict, api_key: str) -> str:
     mode = "mode=transit"
     departure_time = "departure_time=" + str(ride_data["Request Time"])
 
-    request_url = f"https://maps.googleapis.com/maps/api/directions/"
+    request_url = API_BASE_URL
     request_url += f"{output_format}?{endpoints}&key={api_key}&{mode}&{departure_time}"
 
     return request_url
@@ -51,125 +98,418 @@ def encode_endpoints (start_coords: tuple, end_coords: tuple) -> str :
 
 def retrieve_coords(df: pd.core.frame.DataFrame, i:int) -> tuple:
     """Retrieve start & end coordinates from EPP data file."""
-    start_lat = df.iloc[i]["Pickup Latitude"]
-    start_long = df.iloc[i]["Pickup Longitude"]
-    end_lat = df.iloc[i]["Drop Off Latitude"]
-    end_long = df.iloc[i]["Drop Off Longitude"]
+    start_lat, start_long, end_lat, end_long = df.iloc[i][COORDINATE_COLUMNS]
 
     route_data = ((start_lat, start_long), (end_lat,end_long))
     return route_data
 
 
-def pool_data(rides: list):
-    """Pool data into dictionary format to construct final dataframe."""
-    ids = []
-    start_lats = []
-    start_longs = []
-    end_lats = []
-    end_longs = []
-    durations = []
-
-    for ride in rides:
-        if "Transit Duration" in ride:
-            ids.append(ride["ID"])
-            start_lats.append(ride["Start"][0])
-            start_longs.append(ride["Start"][1])
-            end_lats.append(ride["End"][0])
-            end_longs.append(ride["End"][1])
-            durations.append(ride["Transit Duration"])
-
-    df_input = {"ID": ids,
-                "Pickup Latitude": start_lats,
-                "Pickup Longitude": start_longs,
-                "Drop Off Latitude": end_lats,
-                "Drop Off Longitude": end_longs,
-                "Transit Duration": durations}
-
-    duration_df = pd.DataFrame(df_input)
+def retrieve_all_coords(df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Retrieve start & end coordinates of every ride in the EPP data file as float columns."""
+    return df[COORDINATE_COLUMNS].astype("float64").reset_index(drop=True)
+
+
+def pool_data(df: pd.core.frame.DataFrame, ride_times: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Pool ride coordinates and times into the column-oriented ride table used by the rest of the pipeline.
+
+    Ride IDs are row positions in the EPP data file."""
+    rides_df = retrieve_all_coords(df)
+    rides_df.insert(0, "ID", df.index.to_numpy(dtype="int64"))
+
+    for column in ride_times.columns:
+        rides_df[column] = ride_times[column].to_numpy()
+    rides_df["Hour"] = rides_df["Hour"].astype("int8")
+
+    return rides_df
+
+
+def iter_rides(rides_df: pd.core.frame.DataFrame):
+    """Yields rides one at a time in the dictionary format used to construct API calls."""
+    columns = [rides_df[column].to_numpy() for column in ["ID", *COORDINATE_COLUMNS, "Request Time"]]
+    for ride_id, start_lat, start_long, end_lat, end_long, request_time in zip(*columns):
+        yield {"ID": int(ride_id),
+               "Start": (float(start_lat), float(start_long)),
+               "End": (float(end_lat), float(end_long)),
+               "Request Time": int(request_time)}
+
+
+def add_time_splits(rides_df: pd.core.frame.DataFrame, route_summary: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Joins rides with their route summary and derives the transit duration and its walking/bus/waiting split.
+
+    Rides whose archived call gave no public transit directions (no route, or driving directions) are dropped."""
+    usable = route_summary[(route_summary["Status"] == "OK") & ~has_travel_mode(route_summary, "DRIVING")]
+    duration_df = rides_df.merge(usable, on="ID", how="inner")
+
+    uses_transit = has_travel_mode(duration_df, "TRANSIT")
+    transit_seconds = (duration_df["Arrival Time"] - duration_df["Request Time"]).where(uses_transit, duration_df["Leg Duration"]) #walking directions have no arrival time
+    duration_df["Transit Duration"] = (transit_seconds // 60).astype("int64")
+    duration_df["Time Spent - Walking"] = duration_df["Walking Time"] // 60
+    duration_df["Time Spent - Bus"] = duration_df["Transit Time"] // 60
+    duration_df["Time Spent - Waiting"] = duration_df["Transit Duration"] - (duration_df["Time Spent - Bus"] + duration_df["Time Spent - Walking"])
 
     return duration_df
 
 
-def execute_all_api_calls(all_rides, api_key):
-    """Retrieves quickest public transportation directions from Google API. Result is archived on machine."""
-    cwd = getcwd()
-    exising_jsons = listdir(cwd + "\\" + ARCHIVE_DIR)
-    archived_ids = [int(file_name.removesuffix(".json")) for file_name in exising_jsons]
+class TokenBucket:
+    """Thread-safe token bucket used to hold API calls to a fixed rate regardless of response latency."""
 
-    for ride in all_rides:
-        if ride["ID"] in archived_ids:
-            print("ID", ride["ID"], "skipped.")
-            continue
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate #tokens added per second
+        self.capacity = capacity #maximum number of tokens that can be saved up
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
 
-        time.sleep(1 / API_CALL_RATE)
+    def acquire(self):
+        """Blocks until a token is available, then consumes it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_time = (1 - self._tokens) / self.rate
+
+            time.sleep(wait_time)
+
+
+def create_api_session(pool_size: int) -> requests.Session:
+    """Creates a session whose connection pool keeps enough keep-alive connections open for every worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+_archive_store = None
+
+
+def get_archive_store() -> ArchiveStore:
+    """Opens the archive store on first use and reuses it afterwards, or the read-only ArchivePack when ARCHIVE_PACK_PATH is set."""
+    global _archive_store
+    if _archive_store is None:
+        _archive_store = ArchivePack(join(getcwd(), ARCHIVE_PACK_PATH)) if ARCHIVE_PACK_PATH is not None else ArchiveStore(join(getcwd(), ARCHIVE_STORE_PATH))
+
+    return _archive_store
 
-        request_url = construct_request(ride, api_key)
-        transit_route = requests.get(request_url)
 
-        if ride["Start"] == ride["End"]:
-            print("Bad coordinates at ID:", ride["ID"])
-            with open(ERRORS_FILE_NAME, "a+") as file:
-                file.write("Bad coordinates at ID:" + str(ride["ID"]) + '\n')
-                file.write(request_url + '\n')
+_transit_router = None
+
+
+def get_transit_router() -> TransitRouter:
+    """Loads the GTFS feed on first use and reuses the router afterwards."""
+    global _transit_router
+    if _transit_router is None:
+        _transit_router = TransitRouter(GTFS_FEED_PATH)
+
+    return _transit_router
+
+
+_fetch_queue = None
+
+
+def get_fetch_queue() -> FetchQueue:
+    """Opens the fetch queue on first use and reuses it afterwards."""
+    global _fetch_queue
+    if _fetch_queue is None:
+        _fetch_queue = FetchQueue(join(getcwd(), FETCH_QUEUE_FILE_NAME), FETCH_MAX_ATTEMPTS)
+
+    return _fetch_queue
+
+
+_failure_log = None
+
+
+def get_failure_log() -> FailureLog:
+    """Opens the failure log on first use and reuses it afterwards."""
+    global _failure_log
+    if _failure_log is None:
+        _failure_log = FailureLog(join(getcwd(), ERRORS_FILE_NAME))
+
+    return _failure_log
+
+
+def list_archived_ids() -> frozenset:
+    """Retrieves the ids of all rides with an archived API call."""
+    return get_archive_store().ids()
+
+
+def record_api_call_result(ride: dict, request_url: str, request_json: dict, shared_ids: list = ()):
+    """Archives a successful API call and logs routes that did not return public transit directions.
+
+    The result is also archived under shared_ids, the rides that would have made the identical call."""
+    archive_api_call_results(request_json, ride["ID"])
+    for shared_id in shared_ids:
+        archive_api_call_results(request_json, shared_id)
+    METRICS.count("archived", 1 + len(shared_ids))
+
+    status = request_json.get("status")
+    if status == "ZERO_RESULTS": #Google could not find a reasonable connecting route
+        METRICS.count("zero_results")
+
+    failure_log = get_failure_log()
+    try:
+        if "DRIVING" not in get_travel_modes(request_json): #ensures no driving directions were given
+            METRICS.count("transit_routes")
 
         else:
-            request_json = transit_route.json()
-            archive_api_call_results(request_json, ride["ID"])
+            METRICS.count("driving_routes")
+            for ride_id in [ride["ID"], *shared_ids]:
+                failure_log.record(ride_id, "driving_directions", status, request_url)
+
+    except (KeyError, IndexError, TypeError):
+        METRICS.count("no_route")
+        for ride_id in [ride["ID"], *shared_ids]:
+            failure_log.record(ride_id, "no_route", status, request_url)
 
-            try:
-                if "DRIVING" not in get_travel_modes(request_json): #ensures no driving directions were given
-                    duration = request_json["routes"][0]["legs"][0]["duration"]["text"]
-                    print(str(ride["ID"]) + ":", duration)
 
-                else:
-                    print("Route:", ride["ID"], "was provided driving directions.")
-                    with open(ERRORS_FILE_NAME, "a+") as file:
-                        file.write("Route " + str(ride["ID"]) + " was provided driving directions.\n")
-                        file.write(request_url + '\n')
+def record_bad_coordinates(ride: dict, request_url: str):
+    """Logs rides whose pickup and drop off coordinates are identical."""
+    METRICS.count("bad_coordinates")
+    get_failure_log().record(ride["ID"], "bad_coordinates", None, request_url)
 
-            except:
-                print("No route at ID:", ride["ID"])
-                with open(ERRORS_FILE_NAME, "a+") as file:
-                    file.write("No route at ID:" + str(ride["ID"]) + '\n')
-                    file.write(request_url + '\n')
 
+def estimate_walking_route(meters: float) -> dict:
+    """Walking-only result in the Directions API format, archived for rides too short to need an itinerary."""
+    seconds = int(meters * WALKING_DETOUR / WALKING_SPEED)
+    leg = {"duration": {"value": seconds}, "steps": [walking_step(meters * WALKING_DETOUR, seconds)]}
+    return {"geocoded_waypoints": [], "routes": [{"legs": [leg]}], "status": "OK", "prescreened": True}
 
-def add_transit_durations(rides) -> list:
-    """Goes through all archived API calls. Retrieves public transit duration from all successful calls."""
-    archive_path = getcwd() + "\\archive"
-    file_names = listdir(archive_path)
-    ids = [int(file_name.removesuffix(".json")) for file_name in file_names]
 
-    for ride in rides:
-        if ride["ID"] % 100 == 0:
-            print("Ride", ride["ID"], "processed.")
+def prescreen_rides(rides_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Settles rides that do not need a transit itinerary before any call is made, returning the rest.
 
-        if ride["ID"] in ids:
+    Rides with identical pickup and drop off coordinates are logged as bad coordinates. Rides shorter than
+    PRESCREEN_WALKING_DISTANCE are archived with a local walking estimate, as the API returns walking directions for them."""
+    identical = ((rides_df["Pickup Latitude"] == rides_df["Drop Off Latitude"])
+                 & (rides_df["Pickup Longitude"] == rides_df["Drop Off Longitude"])).to_numpy()
+    meters = haversine(rides_df["Pickup Latitude"].to_numpy(), rides_df["Pickup Longitude"].to_numpy(),
+                       rides_df["Drop Off Latitude"].to_numpy(), rides_df["Drop Off Longitude"].to_numpy())
+    walking = ~identical & (meters < PRESCREEN_WALKING_DISTANCE)
 
-            with open(archive_path+ "\\" + str(ride["ID"]) + ".json", 'r') as file:
-                api_call_results = json.load(file)
+    for ride_id in rides_df["ID"].to_numpy()[identical]:
+        record_bad_coordinates({"ID": int(ride_id)}, None)
+
+    walking_entries = [(int(ride_id), estimate_walking_route(float(distance))) for ride_id, distance in zip(rides_df["ID"].to_numpy()[walking], meters[walking])]
+    get_archive_store().put_many(walking_entries)
+    METRICS.count("prescreened_walking", len(walking_entries))
+    METRICS.count("archived", len(walking_entries))
+
+    return rides_df[~identical & ~walking]
+
+
+def canonical_query_key(ride: dict) -> tuple:
+    """Identifies rides that make the same API call: endpoints rounded to QUERY_COORD_PRECISION and the departure minute.
+
+    The departure minute is a unix time, so it also pins the day of the week, or the date when TARGET_WEEK is None."""
+    start_lat, start_long = ride["Start"]
+    end_lat, end_long = ride["End"]
+    return (round(start_lat, QUERY_COORD_PRECISION), round(start_long, QUERY_COORD_PRECISION),
+            round(end_lat, QUERY_COORD_PRECISION), round(end_long, QUERY_COORD_PRECISION),
+            ride["Request Time"] // 60)
 
-            #these skip archived results that do not provide public transit direction
-            if api_call_results["status"] == "ZERO_RESULTS": #this occurs when Google could not find a reasonable connecting route
-                continue
 
-            travel_modes = get_travel_modes(api_call_results)
-            if "DRIVING" in travel_modes:  # ensures no driving directions were given
-                print("Driving route detected: " + str(ride["ID"]))
+class FetchPlan:
+    """Collects the API calls needed by the rides of every chunk of the export, skipping archived rides.
+
+    With DEDUPLICATE_QUERIES set, rides sharing a canonical query key are folded into a single call, whichever chunk
+    they are in. Only rides still needing a call are held, so the plan grows with the rides to fetch, not the export."""
+
+    def __init__(self):
+        self.known_failures = get_failure_log().failed_ids(SKIPPED_FAILURE_CLASSES) if SKIPPED_FAILURE_CLASSES else set()
+        self.planned = {} #query key, or ride id without deduplication, to (ride, ids of other rides sharing its result)
+        self.pending_count = 0
+
+    def add_rides(self, all_rides):
+        """Plans a call for every ride."""
+        for ride in all_rides:
+            self.pending_count += 1
+            query_key = canonical_query_key(ride) if DEDUPLICATE_QUERIES else ride["ID"]
+            if query_key in self.planned:
+                self.planned[query_key][1].append(ride["ID"])
+            else:
+                self.planned[query_key] = (ride, [])
+
+    def add_chunk(self, chunk: pd.core.frame.DataFrame, changed_ids: list, manifest: dict):
+        """Plans calls for rides in a chunk of the export that are new, changed, or not yet archived.
+
+        Archived calls made for the old version of a changed ride are dropped. Rides known to fail are skipped before
+        prescreening, so their failure is not logged again, and rides that need no call are prescreened."""
+        archive_store = get_archive_store()
+        for ride_id in changed_ids:
+            if ride_id in manifest["rides"] and ride_id in archive_store:
+                archive_store.delete(ride_id)
+
+        ride_ids = chunk.index.tolist()
+        archived = [ride_id in archive_store for ride_id in ride_ids]
+        known_failure = [not is_archived and ride_id in self.known_failures for ride_id, is_archived in zip(ride_ids, archived)]
+        METRICS.count("skipped", sum(archived))
+        METRICS.count("skipped_known_failure", sum(known_failure))
+
+        fetch_df = chunk[[not is_archived and not is_known_failure for is_archived, is_known_failure in zip(archived, known_failure)]]
+        fetch_rides_df = pool_data(fetch_df, convert_ride_times(fetch_df, TARGET_WEEK))
+        with METRICS.stage("prescreen"):
+            fetch_rides_df = prescreen_rides(fetch_rides_df)
+
+        self.add_rides(iter_rides(fetch_rides_df))
+
+    def calls(self) -> list:
+        """Lists the planned calls as (ride, ids of other rides sharing its result)."""
+        if DEDUPLICATE_QUERIES:
+            METRICS.count("deduplicated", self.pending_count - len(self.planned))
+            print(self.pending_count - len(self.planned), "of", self.pending_count, "API calls saved by sharing results between identical queries.")
+
+        return list(self.planned.values())
+
+
+def queue_api_calls(calls: list) -> FetchQueue:
+    """Adds planned (ride, shared ids) calls to the fetch queue, along with any left over from an interrupted run."""
+    fetch_queue = get_fetch_queue()
+    fetch_queue.enqueue(calls)
+    return fetch_queue
+
+
+def claim_api_calls(fetch_queue: FetchQueue, limit: int) -> list:
+    """Takes up to limit due calls from the fetch queue, dropping calls whose result was archived just before an interruption."""
+    archive_store = get_archive_store()
+    calls = []
+    for ride, shared_ids, attempts in fetch_queue.claim_due(limit):
+        if ride["ID"] in archive_store:
+            fetch_queue.complete(ride["ID"])
+            continue
+
+        calls.append((ride, shared_ids))
+
+    return calls
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether a failed request may succeed when made again: timeouts, dropped connections, and HTTP 5xx or RETRYABLE_HTTP_STATUSES."""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+
+    http_status = getattr(getattr(error, "response", None), "status_code", None)
+    return http_status is not None and (http_status >= 500 or http_status in RETRYABLE_HTTP_STATUSES)
+
+
+def settle_api_call(fetch_queue: FetchQueue, ride: dict, shared_ids: list, request_url: str, result):
+    """Archives the response of a call and removes it from the queue, or schedules the call again after a transient failure.
+
+    result returns the response or raises the error of the request. Transient request failures (see is_transient_error)
+    and responses with a status in RETRYABLE_STATUSES are retried with backoff, other failed requests are not, as asking
+    again would get the same answer. A call that fails for good or runs out of attempts is logged as request_failed and
+    left unarchived, so the next run tries it again."""
+    try:
+        request_json = result()
+        status = request_json.get("status")
+        retryable = status in RETRYABLE_STATUSES
+    except (requests.RequestException, ValueError) as error:
+        http_status = getattr(getattr(error, "response", None), "status_code", None)
+        status = type(error).__name__ if http_status is None else str(http_status)
+        request_json = None
+        retryable = is_transient_error(error)
+
+    if request_json is not None and not retryable:
+        record_api_call_result(ride, request_url, request_json, shared_ids)
+        fetch_queue.complete(ride["ID"])
+        return
+
+    if retryable and fetch_queue.retry(ride["ID"], status):
+        METRICS.count("retried")
+        return
+
+    if not retryable:
+        fetch_queue.complete(ride["ID"])
+    METRICS.count("request_failed")
+    get_failure_log().record(ride["ID"], "request_failed", status, request_url)
+
+
+def execute_all_api_calls_concurrently(calls: list, api_key, workers: int = FETCH_WORKERS):
+    """Retrieves quickest public transportation directions from Google API with several calls in flight at once.
+
+    Calls are spaced by a token bucket so API_CALL_RATE holds no matter how long each response takes.
+    Calls are taken from the fetch queue as they come due and settled from the calling thread as they complete."""
+    rate_limiter = TokenBucket(API_CALL_RATE, API_CALL_BURST)
+    session = create_api_session(workers)
+    fetch_queue = queue_api_calls(calls)
+    claim_limit = 2 * workers #keeps every worker busy without submitting the whole queue at once
+
+    def fetch(request_url: str) -> dict:
+        rate_limiter.acquire()
+        request_start = time.perf_counter()
+        response = session.get(request_url, timeout=FETCH_TIMEOUT)
+        METRICS.observe("api_latency", time.perf_counter() - request_start)
+        METRICS.count("fetched")
+        response.raise_for_status()
+        return response.json()
+
+    with session, ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+        while True:
+            if len(in_flight) < claim_limit:
+                for ride, shared_ids in claim_api_calls(fetch_queue, claim_limit - len(in_flight)):
+                    request_url = construct_request(ride, api_key)
+                    in_flight[executor.submit(fetch, request_url)] = (ride, request_url, shared_ids)
+
+            wait_time = fetch_queue.seconds_until_due()
+            if not in_flight:
+                if wait_time is None: #every call is settled
+                    break
+
+                time.sleep(wait_time) #only retries waiting out their backoff are left
                 continue
 
-            if "TRANSIT" in travel_modes: #public transit directions
-                arrival_time = api_call_results["routes"][0]["legs"][0]["arrival_time"]["value"]
-                request_time = ride["Request Time"]
-                duration = int((arrival_time - request_time) / 60)
+            #returns once a call completes, or once a retry comes due while there is room for it
+            done, _ = wait(in_flight, timeout=None if len(in_flight) >= claim_limit else wait_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                ride, request_url, shared_ids = in_flight.pop(future)
+                settle_api_call(fetch_queue, ride, shared_ids, request_url, future.result)
+
+    get_failure_log().flush()
+
+
+def execute_all_api_calls(calls: list, api_key):
+    """Retrieves quickest public transportation directions from Google API one call at a time. Result is archived on machine."""
+    fetch_queue = queue_api_calls(calls)
+
+    def fetch(request_url: str) -> dict:
+        time.sleep(1 / API_CALL_RATE)
+        request_start = time.perf_counter()
+        transit_route = requests.get(request_url, timeout=FETCH_TIMEOUT)
+        METRICS.observe("api_latency", time.perf_counter() - request_start)
+        METRICS.count("fetched")
+        transit_route.raise_for_status()
+        return transit_route.json()
 
-            else: #walking directions
-                duration = int(api_call_results["routes"][0]["legs"][0]["duration"]["value"] / 60)
+    while True:
+        wait_time = fetch_queue.seconds_until_due()
+        if wait_time is None:
+            break
 
-            ride["Transit Duration"] = duration
-            ride["Travel Mode"] = travel_modes
+        time.sleep(wait_time)
+        for ride, shared_ids in claim_api_calls(fetch_queue, 1):
+            request_url = construct_request(ride, api_key)
+            settle_api_call(fetch_queue, ride, shared_ids, request_url, lambda: fetch(request_url))
 
-    return rides
+    get_failure_log().flush()
+
+
+def execute_all_routes_locally(calls: list, router: TransitRouter):
+    """Routes planned calls with the in-process GTFS router instead of the Directions API. Results are archived like API results."""
+    for ride, shared_ids in calls:
+        route_start = time.perf_counter()
+        route_json = router.route(ride["Start"], ride["End"], ride["Request Time"])
+        METRICS.observe("routing_latency", time.perf_counter() - route_start)
+        METRICS.count("routed")
+        record_api_call_result(ride, None, route_json, shared_ids)
+
+    get_failure_log().flush()
 
 
 def retrieve_transit_durations(api_call_results, travel_modes) -> int:
@@ -186,20 +526,12 @@ def retrieve_transit_durations(api_call_results, travel_modes) -> int:
 
 def archive_api_call_results(result_json: dict, route_id: int):
     """Archives results of api calls for future reference."""
-    path = getcwd() + "\\" + ARCHIVE_DIR
-    if not isdir(path): # check for existence of archive folder, if it does not exist create it
-        mkdir(path)
-
-    serialized_json = json.dumps(result_json, indent=4)
-    with open(f"{path}\\{route_id}.json", "w+") as file:
-        file.write(serialized_json)
+    get_archive_store().put(route_id, result_json)
 
 
 def load_json_by_id(ride_id: int) -> dict:
-    path = getcwd() + '\\' + ARCHIVE_DIR + f"\\{ride_id}.json"
-    with open(path, 'r') as file:
-        api_call_results = json.load(file)
-    return api_call_results
+    """Retrieves the archived API call results of a ride."""
+    return get_archive_store().get(ride_id)
 
 
 def get_travel_modes(request_json):
@@ -232,134 +564,264 @@ def extract_travel_by_mode(route_id):
     return data
 
 
-def clean_date_data(date_str: str) -> str:
-    """Formats data to be compatible with formatting options available to python's time library."""
-    split_date = date_str.split('/')
-    for i in range(len(split_date)):
-        if len(split_date[i]) == 1:
-            split_date[i] = '0' + split_date[i] #formatting requires double-digit entries for days & months
+def aggregate_time_splits(chunk: pd.core.frame.DataFrame, time_splits_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Aggregates the rides of an export chunk into aggregate cube cells, both as ride share and as public transit trips."""
+    ride_share_df = ride_share_times(chunk)
+    transit_df = time_splits_df[time_splits_df["ID"].isin(chunk.index)].rename(columns={"Time Spent - Walking": "Walking",
+                                                                                         "Time Spent - Bus": "Transit",
+                                                                                         "Time Spent - Waiting": "Waiting"})
+    transit_df = transit_df.join(ride_share_df[["Year", "Weekday"]], on="ID")
+
+    return pd.concat([aggregate_cells(transit_df, "Public Transit", CUBE_BLOCK_SIZE), aggregate_cells(ride_share_df, "Ride Share", CUBE_BLOCK_SIZE)],
+                     ignore_index=True)
 
-    fixed_date = '/'.join(split_date)
 
-    return fixed_date
+def read_ride_export(path: str, chunk_size: int = STREAMING_CHUNK_SIZE):
+    """Streams the ride export in chunks of chunk_size rides, reading only the needed columns with explicit dtypes.
 
+    The row index keeps counting across chunks, so ride ids match reading the whole file at once."""
+    if chunk_size is None:
+        yield pd.read_csv(path, usecols=list(RIDE_EXPORT_DTYPES), dtype=RIDE_EXPORT_DTYPES)
+        return
 
-def clean_time_data(time_str: str) -> str:
-    """Formats data to be compatible with formatting options available to python's time library."""
-    if len(time_str) == 6:
-        time_str = '0' + time_str #double-digit formatting is required for minutes and hours
+    with pd.read_csv(path, usecols=list(RIDE_EXPORT_DTYPES), dtype=RIDE_EXPORT_DTYPES, chunksize=chunk_size) as chunks:
+        yield from chunks
 
-    return time_str
 
+class PreviousTimeSplits:
+    """Reads the previous time splits output, which is sorted by ID, one ID range at a time."""
 
-def retrieve_request_time(df: pd.core.frame.DataFrame, i:int) -> int:
-    """Construct unix time from time recording in main data file."""
-    request_date = clean_date_data(df.iloc[i]["Request Date (Local)"])
-    request_time = clean_time_data(df.iloc[i]["Request Time (Local)"])
-    unix_time = calculate_epoch_time(request_date, request_time)
-    return unix_time
+    def __init__(self, path: str, chunk_size: int = STREAMING_CHUNK_SIZE):
+        self._chunks = iter(iter_time_splits(path, chunk_size)) if path is not None and isfile(path) else iter(())
+        self._buffer = pd.DataFrame(columns=TIME_SPLIT_COLUMNS)
 
+    def take_below(self, upper_id: int) -> pd.core.frame.DataFrame:
+        """Retrieves the rows of the previous output with an ID below upper_id that have not been taken yet."""
+        taken = []
+        while True:
+            below = self._buffer["ID"] < upper_id
+            taken.append(self._buffer[below])
+            self._buffer = self._buffer[~below]
+            if len(self._buffer) > 0:
+                break
 
-def retrieve_drop_off_time(df: pd.core.frame.DataFrame, i:int) -> int:
-    """Construct unix time from time recording in main data file."""
-    request_date = clean_date_data(df.iloc[i]["Drop-off Date (Local)"])
-    request_time = clean_time_data(df.iloc[i]["Drop-off Time (Local)"])
-    unix_time = calculate_epoch_time(request_date, request_time)
-    return unix_time
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = pd.DataFrame(columns=TIME_SPLIT_COLUMNS)
+                break
 
+        return pd.concat(taken, ignore_index=True)
 
-def calculate_epoch_time(date_str, time_str)->int:
-    """Determines seconds since start of epoch based on local time entry."""
-    # convert date info into struct_time object
-    date_format = "%m/%d/%Y"
-    date_struct = time.strptime(date_str, date_format)  # documentation https://docs.python.org/3.12/library/datetime.html#strftime-and-strptime-behavior
 
-    # convert time info into struct_time object
-    time_format = "%I:%M%p"
-    time_struct = time.strptime(time_str, time_format)
+class TimeSplitsWriter:
+    """Writes the final dataset one chunk at a time, plus the per travel mode csv variants when WRITE_PER_MODE_CSVS is set.
 
-    #combined into a single struct_time object
-    input_tuple = (date_struct.tm_year, #year
-                   date_struct.tm_mon, #month
-                   date_struct.tm_mday, #day
-                   time_struct.tm_hour + (LOCAL_TZ - DATA_TZ) if time_struct.tm_hour + (LOCAL_TZ - DATA_TZ) < 24 else 0, #hour
-                   time_struct.tm_min, #minute
-                   time_struct.tm_sec, #second
-                   date_struct.tm_wday, #day of week
-                   date_struct.tm_yday, #day of year
-                   date_struct.tm_isdst) #daylight savings flag
+    The outputs are only replaced once every chunk is written, so the previous outputs stay readable meanwhile."""
 
-    combined_struct = time.struct_time(input_tuple)
-    epoch_time = time.mktime(combined_struct) #convert struct_time object into num of seconds since 1970
+    def __init__(self):
+        self.writers = [TimeSplitsFileWriter(OUTPUT_FILE_NAME, TIME_SPLIT_COLUMNS)]
+        if WRITE_PER_MODE_CSVS:
+            self.writers += [TimeSplitsFileWriter(PER_MODE_FILE_PREFIX + "Walking.csv", ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Walking"]),
+                             TimeSplitsFileWriter(PER_MODE_FILE_PREFIX + "Public Transit.csv", ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Bus"]),
+                             TimeSplitsFileWriter(PER_MODE_FILE_PREFIX + "Waiting.csv", ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Waiting"])]
+        self.rows_written = 0
 
-    return int(epoch_time) #google api requires whole numbers
+    def write(self, transit_duration_df: pd.core.frame.DataFrame):
+        """Appends a chunk of rows to every output."""
+        for writer in self.writers:
+            writer.write(transit_duration_df)
 
+        self.rows_written += len(transit_duration_df)
 
-def massage_time(source_unix_time:int, target_week_unix:int) -> int:
-    """Takes the time retrieved from the data and aligns it with the specified week.
+    def __enter__(self):
+        return self
 
-     The accepted range for the Directions API is ~ -7days to +3 months."""
-    source_time_tuple = time.localtime(source_unix_time)
-    source_day_of_the_week = source_time_tuple.tm_wday #tuple format is used to extract and match days of the week
+    def __exit__(self, exc_type, *exc_info):
+        if exc_type is not None: #previous outputs are left in place when the run fails
+            return
 
-    target_time_tuple = time.localtime(target_week_unix)
-    target_day_of_the_week = target_time_tuple.tm_wday # 0 is Monday, 7 is Sunday
+        for writer in self.writers:
+            writer.close()
 
-    one_day_delta = datetime.timedelta(days=1) # time delta class used to auto handle changes in days, months, years, ect
 
+def fetch_planned_calls(calls: list, api_key: str):
+    """Makes the planned API calls, or routes the rides with the GTFS router."""
+    if ROUTER == "gtfs":
+        execute_all_routes_locally(calls, get_transit_router())
+    elif CONCURRENT_FETCH:
+        execute_all_api_calls_concurrently(calls, api_key)
+    else:
+        execute_all_api_calls(calls, api_key)
 
-    target_week_datetime = datetime.date.fromtimestamp(target_week_unix) # time class compatible with time delta class
-    new_day = target_week_datetime + one_day_delta * (source_day_of_the_week - target_day_of_the_week)
-    new_tuple = new_day.timetuple()
 
-    combined_tuple = (new_tuple.tm_year, #year
-                      new_tuple.tm_mon,  # month
-                      new_tuple.tm_mday,  # day
-                      source_time_tuple.tm_hour,  # hour
-                      source_time_tuple.tm_min,  # minute
-                      source_time_tuple.tm_sec,  # second
-                      new_tuple.tm_wday,  # day of week
-                      new_tuple.tm_yday,  # day of year
-                      new_tuple.tm_isdst)  # daylight savings flag
+def pipeline_parameters() -> dict:
+    """Settings the outputs depend on, previous outputs are discarded when any of them changes."""
+    return {"RIDES_FILE_PATH": RIDES_FILE_PATH, "ARCHIVE_STORE_PATH": ARCHIVE_STORE_PATH, "OUTPUT_FILE_NAME": OUTPUT_FILE_NAME,
+            "TARGET_WEEK": TARGET_WEEK, "DATA_TIMEZONE": DATA_TIMEZONE, "ROUTER": ROUTER, "RIDE_EXPORT_COLUMNS": list(RIDE_EXPORT_DTYPES),
+            "CUBE_FILE_NAME": CUBE_FILE_NAME, "CUBE_BLOCK_SIZE": CUBE_BLOCK_SIZE, "COMPARISON_FILE_NAME": COMPARISON_FILE_NAME}
 
-    combined_unix = int(time.mktime(combined_tuple))
 
-    return combined_unix
+def fetch_new_rides(api_key: str, chunk_size: int = STREAMING_CHUNK_SIZE):
+    """Makes the API calls, or routes rides with the GTFS router, for rides that are new or changed since the last run.
+
+    This is the first pass of run_pipeline with NEW_DATA set, on its own. The manifest is left as it is, so the next
+    run_pipeline processes the fetched rides."""
+    if ARCHIVE_PACK_PATH is not None:
+        raise ValueError("fetched results are archived in ARCHIVE_STORE_PATH, set ARCHIVE_PACK_PATH to None to fetch")
 
+    manifest = load_manifest(MANIFEST_FILE_NAME)
+    if manifest["parameters"] != pipeline_parameters():
+        manifest = empty_manifest()
+
+    fetch_plan = FetchPlan()
+    for chunk in METRICS.timed_iter("ingest", read_ride_export(RIDES_FILE_PATH, chunk_size)):
+        with METRICS.stage("change_detection"):
+            chunk_changed_ids = find_new_or_changed_rides(manifest, hash_rides(chunk))
+
+        with METRICS.stage("fetch_planning"):
+            fetch_plan.add_chunk(chunk, chunk_changed_ids, manifest)
+
+    with METRICS.stage("fetch"):
+        fetch_planned_calls(fetch_plan.calls(), api_key)
+
+
+def run_pipeline(api_key: str, full_rebuild: bool = False, chunk_size: int = STREAMING_CHUNK_SIZE):
+    """Fetches, extracts and records public transit estimates for the ride export.
+
+    Unless full_rebuild is set, only rides that are new or changed since the manifest of the previous run, or whose
+    archived API call changed, are processed and merged into the existing outputs. The export is streamed in chunks
+    of chunk_size rides (None reads it whole), so its rows are never all held at once. The manifest's row hashes and
+    archive versions, the route summary table and the planned API calls still hold a small record per ride, so memory
+    use does grow with the number of rides, only far more slowly than reading the export whole."""
+    if NEW_DATA and ARCHIVE_PACK_PATH is not None:
+        raise ValueError("fetched results are archived in ARCHIVE_STORE_PATH, set ARCHIVE_PACK_PATH to None to fetch")
+
+    archive_store = get_archive_store()
+    parameters = pipeline_parameters()
+
+    manifest = load_manifest(MANIFEST_FILE_NAME)
+    if full_rebuild or manifest["parameters"] != parameters or not isfile(OUTPUT_FILE_NAME): #previous outputs no longer apply, or are gone
+        manifest = empty_manifest()
+
+    if NEW_DATA and RETRY_FAILURE_CLASS is not None: #dropping the archived results makes the first pass fetch these rides again
+        failure_log = get_failure_log()
+        retry_ids = failure_log.failed_ids({RETRY_FAILURE_CLASS})
+        for ride_id in retry_ids:
+            if ride_id in archive_store:
+                archive_store.delete(ride_id)
+        failure_log.clear(RETRY_FAILURE_CLASS)
+        print(len(retry_ids), "rides with", RETRY_FAILURE_CLASS, "failures will be fetched again.")
+
+    input_hash = hash_file(RIDES_FILE_PATH)
+    if (not NEW_DATA and input_hash == manifest["input_hash"] and isfile(OUTPUT_FILE_NAME) and isfile(CUBE_FILE_NAME) and isfile(COMPARISON_FILE_NAME)
+            and not find_changed_archive_entries(manifest, archive_store.versions())):
+        print("No new or changed rides since the last run.")
+        return
+
+    #first pass, finds new or changed rides and makes their API calls once every chunk is planned
+    ride_hashes = {}
+    changed_ids = []
+    fetch_plan = FetchPlan() if NEW_DATA else None
+    for chunk in METRICS.timed_iter("ingest", read_ride_export(RIDES_FILE_PATH, chunk_size)):
+        METRICS.count("rides_read", len(chunk))
+        with METRICS.stage("change_detection"):
+            chunk_hashes = hash_rides(chunk)
+            chunk_changed_ids = find_new_or_changed_rides(manifest, chunk_hashes)
+            ride_hashes.update(chunk_hashes)
+            changed_ids += chunk_changed_ids
+
+        #construct API calls, request times are moved into the window of API calculation
+        if NEW_DATA:
+            with METRICS.stage("fetch_planning"):
+                fetch_plan.add_chunk(chunk, chunk_changed_ids, manifest)
+
+    if NEW_DATA:
+        with METRICS.stage("fetch"):
+            fetch_planned_calls(fetch_plan.calls(), api_key)
+
+    removed_ids = find_removed_rides(manifest, ride_hashes)
+    print(len(changed_ids), "new or changed rides,", len(removed_ids), "removed rides.")
+
+    #process api call data, each archived result is parsed at most once and cached in the route summary table
+    with METRICS.stage("route_summary"):
+        route_summary = load_route_summary(archive_store, ROUTE_SUMMARY_FILE_NAME, PARSE_WORKERS)
+        archive_versions = archive_store.versions()
+    affected_ids = set(changed_ids) | set(find_changed_archive_entries(manifest, archive_versions))
+    METRICS.count("rides_affected", len(affected_ids))
+
+    #blocks of the aggregate cube holding an affected or removed ride are aggregated again, None aggregates every block
+    cube = load_cube(CUBE_FILE_NAME)
+    fresh_cube = manifest["input_hash"] is None or not isfile(CUBE_FILE_NAME)
+    dirty_blocks = None if fresh_cube else {ride_id // CUBE_BLOCK_SIZE for ride_id in affected_ids.union(removed_ids)}
+    cube_cells = [empty_cube()]
+
+    #second pass, construction & recording of final dataset
+    #rows of the previous output are carried over unless their ride was affected, rows of removed rides are dropped
+    previous_time_splits = PreviousTimeSplits(OUTPUT_FILE_NAME if manifest["input_hash"] is not None else None, chunk_size)
+    #per ride comparisons are cheap to derive, so they are rebuilt for every ride from the same rows as the output
+    comparison_writer = TimeSplitsFileWriter(COMPARISON_FILE_NAME, COMPARISON_COLUMNS, COMPARISON_DTYPES)
+    with TimeSplitsWriter() as writer:
+        for chunk in METRICS.timed_iter("ingest", read_ride_export(RIDES_FILE_PATH, chunk_size)):
+            if len(chunk) == 0:
+                continue
+
+            with METRICS.stage("time_conversion"):
+                affected_chunk = chunk[chunk.index.isin(affected_ids)]
+                rides_df = pool_data(affected_chunk, convert_ride_times(affected_chunk, TARGET_WEEK))
+            with METRICS.stage("time_splits"):
+                transit_duration_df = add_time_splits(rides_df, route_summary)
+
+            with METRICS.stage("output_write"):
+                kept_df = previous_time_splits.take_below(chunk.index[-1] + 1)
+                kept_df = kept_df[~kept_df["ID"].isin(affected_ids)]
+                time_splits_df = pd.concat([kept_df, transit_duration_df[TIME_SPLIT_COLUMNS]], ignore_index=True).sort_values("ID", ignore_index=True)
+                writer.write(time_splits_df)
+
+            with METRICS.stage("comparison"):
+                comparison_writer.write(compare_rides(ride_share_times(chunk), time_splits_df))
+
+            with METRICS.stage("aggregation"):
+                dirty_chunk = chunk if dirty_blocks is None else chunk[(chunk.index // CUBE_BLOCK_SIZE).isin(dirty_blocks)]
+                if len(dirty_chunk) > 0:
+                    cube_cells.append(aggregate_time_splits(dirty_chunk, time_splits_df))
+    METRICS.count("rows_written", writer.rows_written)
+    comparison_writer.close() #only reached once every chunk is written, as with the time splits output
+
+    with METRICS.stage("aggregation"):
+        save_cube(replace_blocks(cube, dirty_blocks, pd.concat(cube_cells, ignore_index=True)), CUBE_FILE_NAME)
+
+    save_manifest({"parameters": parameters, "input_hash": input_hash, "rides": ride_hashes, "archive_versions": archive_versions},
+                  MANIFEST_FILE_NAME)
+
+
+def close_stores():
+    """Closes the archive store, failure log and fetch queue if they were opened, so they can be opened afresh."""
+    global _archive_store, _failure_log, _fetch_queue
+    for store in (_archive_store, _failure_log, _fetch_queue):
+        if store is not None:
+            store.close()
+
+    _archive_store = _failure_log = _fetch_queue = None
 
-def military_time_from_unix(unix_time:int) -> str:
-    """Turns unix time back into a human-readable time, while accounting for timezone changes."""
-    time_struct = time.localtime(unix_time)
-    time_hour = time_struct.tm_hour + (DATA_TZ - LOCAL_TZ) if time_struct.tm_hour + (DATA_TZ - LOCAL_TZ) < 24 else 0
-    time_min = time_struct.tm_min
-    military_time = str(time_hour) + ":" + str(time_min)
-    return military_time
 
 #################### UTILITIES ####################
 #misc functions used for debugging & testing
 
-def construct_api_call_for_id(ride_id: int) -> str:
-    """Creates the html address used to make the call for a specific ride."""
+def construct_api_call_for_id(df: pd.core.frame.DataFrame, ride_id: int) -> str:
+    """Creates the html address used to make the call for a specific ride, df being the whole EPP data file as read by read_ride_export(path, None)."""
     api_key = retrieve_api_key(API_KEY_FILE_NAME)
     ride_data = {}
-    ride_data["Start"], ride_data["End"] = retrieve_coords(eppDF, ride_id)
+    ride_data["Start"], ride_data["End"] = retrieve_coords(df, ride_id)
 
-    original_unix_time = retrieve_request_time(eppDF, ride_id)
-    target_unix_time = calculate_epoch_time(TARGET_WEEK,"5:00PM")  # time_str here is not used. Only provided to fulfill argument requirements.
-    in_zone_time = massage_time(original_unix_time, target_unix_time)
-    ride_data["Request Time"] = in_zone_time
+    ride_data["Request Time"] = int(convert_ride_times(df.iloc[[ride_id]], TARGET_WEEK)["Request Time"].iloc[0])
 
     api_call_html = construct_request(ride_data, api_key)
     return api_call_html
 
 def generate_mode_counts() -> dict:
     """Counts the number of routes utilizing each combination of transportation options."""
-    archive_path = getcwd() + "\\archive"
-    file_names = listdir(archive_path)
-    ids = [int(file_name.removesuffix(".json")) for file_name in file_names]
-
     travel_counts = {}
-    for id_ in ids:
+    for id_ in list_archived_ids():
         api_call_results = load_json_by_id(id_)
 
         # these skip archived results that do not provide public transit direction
@@ -383,95 +845,10 @@ def generate_mode_counts() -> dict:
 
 
 if __name__ == "__main__":
-    api_key = retrieve_api_key(API_KEY_FILE_NAME)
-    eppDF = pd.read_csv(RIDES_FILE_PATH)
-    print(construct_api_call_for_id(10))
-
-    #retrieve data from file
-    data = []
-    for i in range(eppDF.shape[0]): #loops through all rows in source data
-        ride = {}
-        ride["ID"] = i
-        ride["Start"], ride["End"] = retrieve_coords(eppDF, i)
-        ride["Request Time"] = retrieve_request_time(eppDF, i)
-        ride["Drop-off Time"] = retrieve_drop_off_time(eppDF, i)
-        ride["Ride Share - Total Time"] =  ride["Drop-off Time"] - ride["Request Time"]
-
-        data.append(ride)
-
-    #moves historic times into the window of API calculation
-    for ride in data:
-        original_unix_time = ride["Request Time"]
-        target_unix_time = calculate_epoch_time(TARGET_WEEK, "5:00PM")  # time_str here is not used. Only provided to fulfill argument requirements.
-        in_zone_time = massage_time(original_unix_time, target_unix_time)
-        ride["Request Time"] = in_zone_time
-
-    #construct and execute API calls
-    if NEW_DATA:
-        execute_all_api_calls(data, api_key)
-
-    #process api call data
-    archive_path = getcwd() + '\\' + ARCHIVE_DIR
-    file_names = listdir(archive_path)
-    ids = [int(file_name.removesuffix(".json")) for file_name in file_names]
-
-    for ride in data:
-        if ride["ID"] % 100 == 0:
-            print("Ride", ride["ID"], "processed.")
-
-        if ride["ID"] in ids:
-            api_call_results = load_json_by_id(ride["ID"])
-            # these skip archived results that do not provide public transit direction
-            if api_call_results["status"] in ["ZERO_RESULTS", "UNKNOWN_ERROR"]:  # this occurs when Google could not find a reasonable connecting route
-                continue
-
-            travel_modes = get_travel_modes(api_call_results)
-
-            duration = retrieve_transit_durations(api_call_results, travel_modes)
-            ride["Transit Duration"] = duration
-            ride["Travel Mode"] = travel_modes
-
-    #construction & recording of final dataset
-    transit_duration_df = pool_data(data)
-
-    #temporary time
-    hour_column = []
-    for ride in data:
-        if "Transit Duration" in ride: #only present if API call was successful in creating public transportation directions
-            hour = int(military_time_from_unix(ride["Request Time"]).split(":")[0])
-            hour_column.append(hour)
-    transit_duration_df["Hour"] = hour_column
-
-    #epp to public transit ratio
-    # eppDurations = eppDF[["ID", "Total Time (min)"]]
-    # publicTransitDurations = transit_duration_df[["ID", "Transit Duration"]]
-    # mergedDF = pd.merge(eppDurations, publicTransitDurations, on="ID")
-    # mergedDF["Ratio"] = mergedDF["Transit Duration"] / mergedDF["Total Time (min)"]
-    # transit_duration_df["Duration Ratio"] = mergedDF["Ratio"]
-
-    #time splits
-    walking_times = [extract_travel_by_mode(int(route["ID"]))["WALKING"]["TIME"] for i, route in transit_duration_df.iterrows()]
-    transit_duration_df["Time Spent - Walking"] = walking_times
-
-    bus_times = []
-    for i, route in transit_duration_df.iterrows():
-        time_split = extract_travel_by_mode(int(route["ID"]))
-        if "TRANSIT" in time_split:
-            bus_times.append(time_split["TRANSIT"]["TIME"])
-        else:
-            bus_times.append(0)
-
-    transit_duration_df["Time Spent - Bus"] = bus_times
-
-    transit_duration_df["Time Spent - Waiting"] = transit_duration_df["Transit Duration"] - (transit_duration_df["Time Spent - Bus"] + transit_duration_df["Time Spent - Walking"])
-
-    #file creation
-    walkingTimesDF = transit_duration_df[ ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Walking"]]
-    busTimesDF = transit_duration_df[ ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Bus"]]
-    waitingTimesDF = transit_duration_df[ ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Waiting"]]
-    allTimesDF = transit_duration_df[ ["ID", "Pickup Latitude", "Pickup Longitude", "Transit Duration", "Hour", "Time Spent - Bus", "Time Spent - Walking", "Time Spent - Waiting"]]
-
-    walkingTimesDF.to_csv(OUTPUT_FILE_NAME + "Walking.csv")
-    busTimesDF.to_csv(OUTPUT_FILE_NAME + "Public Transit.csv")
-    waitingTimesDF.to_csv(OUTPUT_FILE_NAME + "Waiting.csv")
-    allTimesDF.to_csv(OUTPUT_FILE_NAME)
+    api_key = retrieve_api_key(API_KEY_FILE_NAME) if ROUTER == "google" else None
+    METRICS.profiled_stages = PROFILED_STAGES
+    try:
+        run_pipeline(api_key, FULL_REBUILD)
+    finally:
+        close_stores()
+        METRICS.write(METRICS_FILE_NAME)
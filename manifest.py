@@ -0,0 +1,68 @@
+import hashlib
+import json
+from os.path import isfile
+import pandas as pd
+from atomic_files import atomic_write
+
+MANIFEST_FILE_NAME = "pipeline_manifest.json"
+
+
+def empty_manifest() -> dict:
+    """Manifest of a pipeline that has not processed anything yet."""
+    return {"parameters": {}, "input_hash": None, "rides": {}, "archive_versions": {}}
+
+
+def load_manifest(path: str = MANIFEST_FILE_NAME) -> dict:
+    """Retrieves the manifest written by the previous run, or an empty one when there is none."""
+    if not isfile(path):
+        return empty_manifest()
+
+    with open(path, 'r') as file:
+        manifest = json.load(file)
+
+    #json object keys are always strings, ride ids are restored to integers
+    manifest["rides"] = {int(ride_id): row_hash for ride_id, row_hash in manifest["rides"].items()}
+    manifest["archive_versions"] = {int(ride_id): version for ride_id, version in manifest["archive_versions"].items()}
+    return manifest
+
+
+def save_manifest(manifest: dict, path: str = MANIFEST_FILE_NAME):
+    """Records what the current run processed."""
+    with atomic_write(path) as temp_path, open(temp_path, 'w') as file:
+        json.dump(manifest, file)
+
+
+def hash_file(path: str) -> str:
+    """Fingerprints the full contents of an input file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def hash_rides(df: pd.core.frame.DataFrame) -> dict:
+    """Fingerprints every row of the ride export, keyed by ride id (row position)."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False)
+    return dict(zip(df.index.tolist(), row_hashes.tolist()))
+
+
+def find_new_or_changed_rides(manifest: dict, ride_hashes: dict) -> list:
+    """Lists rides that are new or whose row changed since the manifest, looking only at the rides in ride_hashes."""
+    recorded = manifest["rides"]
+    return [ride_id for ride_id, row_hash in ride_hashes.items() if recorded.get(ride_id) != row_hash]
+
+
+def find_removed_rides(manifest: dict, ride_hashes: dict) -> list:
+    """Lists rides in the manifest that are no longer in the ride export, ride_hashes covering the whole export."""
+    return [ride_id for ride_id in manifest["rides"] if ride_id not in ride_hashes]
+
+
+def find_changed_archive_entries(manifest: dict, archive_versions: dict) -> list:
+    """Lists rides whose archived API call was added, rewritten or deleted since the manifest was written."""
+    recorded = manifest["archive_versions"]
+    changed = [ride_id for ride_id, version in archive_versions.items() if recorded.get(ride_id) != version]
+    changed += [ride_id for ride_id in recorded if ride_id not in archive_versions]
+
+    return changed
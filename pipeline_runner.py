@@ -0,0 +1,323 @@
+import argparse
+import hashlib
+import json
+import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from inspect import getsourcefile
+from os import makedirs, replace
+from os.path import basename, dirname, isdir, isfile, join, normpath
+import main
+import render_charts
+import spatial_grid
+import temp_data_processing
+import aggregate_cube
+import manifest
+import ride_comparison
+import ride_times
+import route_summary
+import time_splits_io
+from archive_store import ArchiveStore
+from atomic_files import atomic_write
+from manifest import hash_file
+
+PIPELINE_CACHE_DIR = "pipeline_cache" #outputs of every stage run, stored under the hash of what they were made from, safe to delete
+PIPELINE_STATE_FILE_NAME = "pipeline_state.json" #cache key and output fingerprints of the latest run of each stage
+#settings of main.py handed to the worker process running it, so stages see the same values as the runner
+MAIN_SETTINGS = ["RIDES_FILE_PATH", "ARCHIVE_STORE_PATH", "ARCHIVE_PACK_PATH", "OUTPUT_FILE_NAME", "TARGET_WEEK", "ROUTER", "GTFS_FEED_PATH", "API_BASE_URL",
+                 "API_CALL_RATE", "CONCURRENT_FETCH", "FETCH_WORKERS", "PRESCREEN_WALKING_DISTANCE", "DEDUPLICATE_QUERIES",
+                 "QUERY_COORD_PRECISION", "SKIPPED_FAILURE_CLASSES", "PARSE_WORKERS"]
+#settings that change what the fetch archives, on top of main.pipeline_parameters
+FETCH_PARAMETERS = ["GTFS_FEED_PATH", "API_BASE_URL", "PRESCREEN_WALKING_DISTANCE", "DEDUPLICATE_QUERIES", "QUERY_COORD_PRECISION"]
+
+
+class Stage:
+    """A step of the pipeline: a function writing output files from input files and settings.
+
+    A stage runs once every stage writing one of its inputs is done. Its cache key hashes its parameters, the
+    contents of its inputs and the source files of its code, so a stage whose key and outputs are unchanged since
+    its last run is not run again. Outputs of cached stages are also kept under their key in PIPELINE_CACHE_DIR and
+    copied back instead of running the stage when an earlier key comes round again. Untracked stages are run every
+    time, they skip whatever is up to date themselves."""
+
+    def __init__(self, function, arguments: list, inputs: list, outputs: list, parameters: dict = None, sources: list = (), cached: bool = True,
+                 tracked: bool = True):
+        self.function = function
+        self.arguments = arguments
+        self.inputs = [normpath(path) for path in inputs]
+        self.outputs = [normpath(path) for path in outputs]
+        self.parameters = parameters or {}
+        self.sources = [getsourcefile(function), *(getsourcefile(module) for module in sources)]
+        self.cached = cached #false for outputs updated in place, such as the archive store
+        self.tracked = tracked #false for stages with their own skipping, such as the figures and render_charts' render state
+
+
+def run_main(step: str, settings: dict, api_key: str = None):
+    """Runs the fetch or the processing of main.py in a worker process with the given settings.
+
+    Fetching is left to the fetch stage, whatever NEW_DATA is set to. The metrics of the run are written to
+    main.METRICS_FILE_NAME, prefixed with "fetch_" for the fetch so the processing does not overwrite them."""
+    for name, value in settings.items():
+        setattr(main, name, value)
+    main.NEW_DATA = False
+    main.METRICS.reset() #worker processes are reused from stage to stage
+    main.METRICS.profiled_stages = main.PROFILED_STAGES
+
+    try:
+        if step == "fetch":
+            main.fetch_new_rides(api_key)
+        else:
+            main.run_pipeline(api_key)
+    finally:
+        main.close_stores()
+        main.METRICS.write("fetch_" + main.METRICS_FILE_NAME if step == "fetch" else main.METRICS_FILE_NAME)
+
+
+def write_spatial_grid(time_splits_path: str, rides_path: str, output_path: str):
+    """Builds the spatial grid and writes it out, as spatial_grid.py does when run directly."""
+    spatial_grid.build_spatial_grid(time_splits_path, rides_path).to_csv(output_path, index=False)
+
+
+def render_figures(output_dir: str, force: bool = False):
+    """Renders the report figures with render_charts, which skips figures unchanged since their last render."""
+    outcomes = render_charts.render_charts(None, output_dir, force=force)
+    for name, outcome in outcomes.items():
+        print(f"figure {name}: {outcome}")
+
+    failed = [name for name, outcome in outcomes.items() if outcome.startswith("failed")]
+    if failed:
+        raise RuntimeError(f"figures failed to render: {', '.join(failed)}")
+
+
+def pipeline_stages(fetch: bool = False, api_key: str = None, output_dir: str = render_charts.OUTPUT_DIR, force: set = ()) -> dict:
+    """Every stage of the pipeline, keyed by name, built from the settings of main.py and the other scripts.
+
+    Ingest and time conversion stream through the export in chunks inside the fetch and time splits stages.
+    The fetch stage is only included when fetch is set, taking the place of NEW_DATA. Stages named in force are
+    run even when they are up to date."""
+    settings = {name: getattr(main, name) for name in MAIN_SETTINGS}
+    parameters = main.pipeline_parameters()
+    stages = {}
+
+    temp_input = temp_data_processing.TEMP_INPUT_NAME + ".csv"
+    if isfile(temp_input): #only present while temp durations are being worked on
+        stages["temp_coordinates"] = Stage(temp_data_processing.process_temp_durations, [],
+                                           [temp_input, temp_data_processing.RIDES_FILE_NAME + ".csv"],
+                                           list(temp_data_processing.coordinate_file_names().values()))
+
+    if fetch:
+        fetch_inputs = [main.RIDES_FILE_PATH, *([main.GTFS_FEED_PATH] if main.ROUTER == "gtfs" else [])]
+        stages["fetch"] = Stage(run_main, ["fetch", settings, api_key], fetch_inputs, [main.ARCHIVE_STORE_PATH],
+                                {**parameters, **{name: settings[name] for name in FETCH_PARAMETERS}},
+                                [main, ride_times], cached=False)
+
+    #extraction, time splits, aggregation and the per ride comparison, along with the manifest they were made with
+    archive_path = main.ARCHIVE_PACK_PATH if main.ARCHIVE_PACK_PATH is not None else main.ARCHIVE_STORE_PATH
+    stages["time_splits"] = Stage(run_main, ["time_splits", settings], [main.RIDES_FILE_PATH, archive_path],
+                                  [main.OUTPUT_FILE_NAME, main.CUBE_FILE_NAME, main.COMPARISON_FILE_NAME, main.MANIFEST_FILE_NAME],
+                                  parameters, [main, route_summary, ride_times, aggregate_cube, ride_comparison, time_splits_io, manifest])
+    stages["spatial_grid"] = Stage(write_spatial_grid, [main.OUTPUT_FILE_NAME, main.RIDES_FILE_PATH, spatial_grid.GRID_FILE_NAME],
+                                   [main.OUTPUT_FILE_NAME, main.RIDES_FILE_PATH], [spatial_grid.GRID_FILE_NAME],
+                                   {"GRID_CELL_SIZE": spatial_grid.GRID_CELL_SIZE}, [spatial_grid, ride_times, time_splits_io])
+
+    #figures wait for the stages writing their inputs, figures whose other inputs are missing are reported by render_charts
+    specs = render_charts.figure_specs(output_dir).values()
+    written = {path for stage in stages.values() for path in stage.outputs}
+    figure_inputs = sorted({normpath(path) for function, arguments, input_files, sources in specs for path in input_files})
+    stages["figures"] = Stage(render_figures, [output_dir, "figures" in force], [path for path in figure_inputs if path in written or isfile(path)],
+                              [arguments[1] for function, arguments, input_files, sources in specs], tracked=False)
+
+    return stages
+
+
+def stage_dependencies(stages: dict) -> dict:
+    """Maps each stage to the stages writing one of its inputs."""
+    writers = {path: name for name, stage in stages.items() for path in stage.outputs}
+    return {name: {writers[path] for path in stage.inputs if writers.get(path, name) != name} for name, stage in stages.items()}
+
+
+def fingerprint_file(path: str) -> str:
+    """Content hash of a file, None when it does not exist.
+
+    The archive store is fingerprinted by the versions of its entries, which change whenever an entry does,
+    as its file lags behind its write-ahead log."""
+    if not isfile(path):
+        return None
+
+    if path == normpath(main.ARCHIVE_STORE_PATH):
+        with ArchiveStore(path) as archive_store:
+            versions = sorted(archive_store.versions().items())
+        return hashlib.sha256(json.dumps(versions).encode()).hexdigest()
+
+    return hash_file(path)
+
+
+def cache_key(name: str, stage: Stage) -> str:
+    """Hashes what the outputs of a stage are made from: its parameters, the contents of its inputs and its code."""
+    description = {"stage": name,
+                   "parameters": stage.parameters,
+                   "inputs": {path: fingerprint_file(path) for path in stage.inputs},
+                   "sources": {basename(path): hash_file(path) for path in stage.sources}}
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+def cached_files(key: str, outputs: list, cache_dir: str) -> list:
+    return [join(cache_dir, key[:2], key, f"{i}_{basename(path)}") for i, path in enumerate(outputs)]
+
+
+def store_outputs(key: str, outputs: list, cache_dir: str = PIPELINE_CACHE_DIR):
+    """Copies the outputs of a stage run into the cache under its key. The entry only appears once every file is in."""
+    entry = join(cache_dir, key[:2], key)
+    if isdir(entry):
+        return
+
+    temp_entry = entry + ".tmp"
+    shutil.rmtree(temp_entry, ignore_errors=True)
+    makedirs(temp_entry)
+    for path, cached_file in zip(outputs, cached_files(key, outputs, cache_dir)):
+        shutil.copyfile(path, join(temp_entry, basename(cached_file)))
+    replace(temp_entry, entry)
+
+
+def restore_outputs(key: str, outputs: list, cache_dir: str = PIPELINE_CACHE_DIR) -> bool:
+    """Copies the outputs cached under key back into place. Returns False when nothing is cached under it."""
+    files = cached_files(key, outputs, cache_dir)
+    if not all(isfile(cached_file) for cached_file in files):
+        return False
+
+    for cached_file, path in zip(files, outputs):
+        with atomic_write(path) as temp_path:
+            shutil.copyfile(cached_file, temp_path)
+
+    return True
+
+
+def load_pipeline_state(path: str = PIPELINE_STATE_FILE_NAME) -> dict:
+    if not isfile(path):
+        return {}
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_pipeline_state(state: dict, path: str = PIPELINE_STATE_FILE_NAME):
+    with atomic_write(path) as temp_path, open(temp_path, 'w') as file:
+        json.dump(state, file, indent=4)
+
+
+def select_stages(stages: dict, targets: list) -> dict:
+    """Narrows the stages down to the targets and every stage they depend on, all of them when targets is empty."""
+    if not targets:
+        return stages
+
+    dependencies = stage_dependencies(stages)
+    selected = set()
+    remaining = list(targets)
+    while remaining:
+        name = remaining.pop()
+        if name not in selected:
+            selected.add(name)
+            remaining.extend(dependencies[name])
+
+    return {name: stage for name, stage in stages.items() if name in selected}
+
+
+def run_stages(stages: dict, workers: int = None, force: set = (), state_path: str = PIPELINE_STATE_FILE_NAME,
+               cache_dir: str = PIPELINE_CACHE_DIR) -> dict:
+    """Runs every stale stage in dependency order, independent stages side by side in worker processes.
+
+    A stage is up to date when its cache key and outputs match its last run, restored when its outputs are cached
+    under its current key, and run otherwise or when it is named in force. Untracked stages always run. Stages after a
+    failed or missing input are left out. Returns the outcome of every stage."""
+    state = load_pipeline_state(state_path)
+    dependencies = stage_dependencies(stages)
+    pending = dict(stages)
+    done = set()
+    outcomes = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        running = {}
+        while pending or running:
+            progressed = False
+            for name, stage in list(pending.items()):
+                if any(dependency in outcomes and dependency not in done for dependency in dependencies[name]):
+                    outcomes[name] = "skipped, an earlier stage did not finish"
+                    del pending[name]
+                    continue
+
+                if not dependencies[name] <= done:
+                    continue
+
+                del pending[name]
+                progressed = True
+                missing = [path for path in stage.inputs if not isfile(path)]
+                if missing:
+                    outcomes[name] = f"missing input {', '.join(missing)}"
+                    continue
+
+                key = cache_key(name, stage) if stage.tracked else None
+                recorded = state.get(name, {})
+                if name not in force and stage.tracked and recorded.get("key") == key and recorded.get("outputs") == {path: fingerprint_file(path) for path in stage.outputs}:
+                    outcomes[name] = "up to date"
+                    done.add(name)
+                    continue
+
+                if name not in force and stage.tracked and stage.cached and restore_outputs(key, stage.outputs, cache_dir):
+                    state[name] = {"key": key, "outputs": {path: fingerprint_file(path) for path in stage.outputs}}
+                    save_pipeline_state(state, state_path)
+                    outcomes[name] = "restored from cache"
+                    done.add(name)
+                    continue
+
+                for path in stage.outputs:
+                    if dirname(path):
+                        makedirs(dirname(path), exist_ok=True)
+                running[executor.submit(stage.function, *stage.arguments)] = (name, key)
+
+            if not running:
+                if not progressed: #stages waiting on each other can never run
+                    outcomes.update(dict.fromkeys(pending, "skipped, circular dependency"))
+                    break
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                stage = stages[name]
+                try:
+                    future.result()
+                    missing = [path for path in stage.outputs if not isfile(path)]
+                    if missing and stage.tracked: #untracked stages report what they could not write themselves
+                        raise FileNotFoundError(f"stage did not write {', '.join(missing)}")
+                except Exception as error: #stages that do not depend on the failed one still run
+                    outcomes[name] = f"failed: {error!r}"
+                    state.pop(name, None)
+                else:
+                    if stage.tracked:
+                        if stage.cached:
+                            store_outputs(key, stage.outputs, cache_dir)
+                        state[name] = {"key": key, "outputs": {path: fingerprint_file(path) for path in stage.outputs}}
+                    outcomes[name] = "ran"
+                    done.add(name)
+
+                save_pipeline_state(state, state_path) #finished stages are kept even if a later one is interrupted
+
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the stale stages of the pipeline, from the ride export to the report figures.")
+    parser.add_argument("--stages", nargs="+", help="stages to bring up to date along with the stages they depend on, all of them by default")
+    parser.add_argument("--fetch", action="store_true", help="also fetch new and changed rides, instead of setting NEW_DATA in main.py")
+    parser.add_argument("--force", nargs="+", default=[], help="stages to run even when they are up to date")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes running stages side by side")
+    args = parser.parse_args()
+
+    api_key = main.retrieve_api_key(main.API_KEY_FILE_NAME) if args.fetch and main.ROUTER == "google" else None
+    all_stages = pipeline_stages(args.fetch, api_key, force=set(args.force))
+    unknown = set(args.stages or []).union(args.force) - set(all_stages)
+    if unknown:
+        parser.error(f"unknown stages {', '.join(sorted(unknown))}, choose from {', '.join(all_stages)}")
+
+    stage_outcomes = run_stages(select_stages(all_stages, args.stages), args.workers, set(args.force))
+    for stage_name, outcome in stage_outcomes.items():
+        print(f"{stage_name}: {outcome}")
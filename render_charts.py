@@ -0,0 +1,119 @@
+import argparse
+import json
+import matplotlib
+matplotlib.use("Agg") #renders to files only, set before any chart script imports pyplot
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from inspect import getsourcefile
+from os import makedirs
+from os.path import isfile, join
+from atomic_files import atomic_write
+from manifest import hash_file
+import aggregate_cube
+import duration_distributions
+import time_splits_io
+from aggregate_cube import CUBE_FILE_NAME
+from stacked_bar_chart_generation import render_stacked_bar_chart
+from stacked_bar_chart_generation_hourly import render_hourly_stacked_bar_chart
+from generate_occurrence_histograms import INPUT_FILE_NAME_2023, INPUT_FILE_NAME_2024, TRIM_THRESHOLD, render_histogram
+
+OUTPUT_DIR = "figures"
+RENDER_STATE_FILE_NAME = "render_state.json" #fingerprints of the inputs each figure was last rendered from
+
+
+def figure_specs(output_dir: str) -> dict:
+    """Every figure of the report, as the function drawing it, its arguments, the files it is drawn from,
+    and the modules other than the drawing script that shape it."""
+    histogram_inputs = [INPUT_FILE_NAME_2023, INPUT_FILE_NAME_2024]
+    cube_sources = [aggregate_cube]
+    histogram_sources = [duration_distributions, time_splits_io]
+    return {"stacked_bar": (render_stacked_bar_chart, [CUBE_FILE_NAME, join(output_dir, "stacked_bar.png")], [CUBE_FILE_NAME], cube_sources),
+            "hourly_stacked_bar": (render_hourly_stacked_bar_chart, [CUBE_FILE_NAME, join(output_dir, "hourly_stacked_bar.png")], [CUBE_FILE_NAME], cube_sources),
+            "histogram_all": (render_histogram, [histogram_inputs, join(output_dir, "histogram_all.png")], histogram_inputs, histogram_sources),
+            "histogram_trimmed": (render_histogram, [histogram_inputs, join(output_dir, "histogram_trimmed.png"), TRIM_THRESHOLD], histogram_inputs, histogram_sources)}
+
+
+def load_render_state(path: str = RENDER_STATE_FILE_NAME) -> dict:
+    if not isfile(path):
+        return {}
+
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+def save_render_state(state: dict, path: str = RENDER_STATE_FILE_NAME):
+    with atomic_write(path) as temp_path, open(temp_path, 'w') as file:
+        json.dump(state, file, indent=4)
+
+
+def fingerprint(function, arguments: list, input_files: list, sources: list = ()) -> dict:
+    """Identifies what a figure is drawn from: its input files, its arguments, the script drawing it and the modules it draws with."""
+    source_files = [getsourcefile(function)] + [getsourcefile(module) for module in sources]
+    return {"arguments": repr(arguments),
+            "source": {path: hash_file(path) for path in source_files},
+            "inputs": {path: hash_file(path) if isfile(path) else None for path in input_files}}
+
+
+def render_figure(function, arguments: list):
+    """Draws a single figure and releases it, run in a worker process."""
+    try:
+        function(*arguments)
+    finally:
+        plt.close("all")
+
+
+def render_charts(names: list = None, output_dir: str = OUTPUT_DIR, workers: int = None, force: bool = False) -> dict:
+    """Renders the named figures, or all of them, in parallel worker processes.
+
+    Figures whose inputs, arguments and scripts are unchanged since their last render are skipped unless force is set.
+    Returns the outcome of every figure: rendered, skipped, or the error it failed with."""
+    makedirs(output_dir, exist_ok=True)
+    specs = figure_specs(output_dir)
+    state = load_render_state(join(output_dir, RENDER_STATE_FILE_NAME))
+    outcomes = {}
+    pending = {}
+
+    for name in names or specs:
+        function, arguments, input_files, sources = specs[name]
+        current = fingerprint(function, arguments, input_files, sources)
+        if not force and state.get(name) == current and isfile(arguments[1]):
+            outcomes[name] = "skipped"
+            continue
+
+        missing = [path for path, file_hash in current["inputs"].items() if file_hash is None]
+        if missing:
+            outcomes[name] = f"missing input {', '.join(missing)}"
+            continue
+
+        pending[name] = current
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers or len(pending), len(pending))) as executor:
+            futures = {executor.submit(render_figure, *specs[name][:2]): name for name in pending}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except Exception as error: #one broken figure does not stop the others
+                    outcomes[name] = f"failed: {error!r}"
+                    state.pop(name, None)
+                else:
+                    outcomes[name] = "rendered"
+                    state[name] = pending[name]
+
+        save_render_state(state, join(output_dir, RENDER_STATE_FILE_NAME))
+
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renders every report figure to image files without opening any windows.")
+    parser.add_argument("--figures", nargs="+", choices=list(figure_specs(OUTPUT_DIR)), help="figures to render, all of them by default")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, one per figure by default")
+    parser.add_argument("--force", action="store_true", help="render figures even when their inputs have not changed")
+    args = parser.parse_args()
+
+    figure_outcomes = render_charts(args.figures, args.output_dir, args.workers, args.force)
+    for figure_name, outcome in figure_outcomes.items():
+        print(f"{figure_name}: {outcome}")
@@ -0,0 +1,70 @@
+import argparse
+import pandas as pd
+from time_splits_io import PARQUET_AVAILABLE, read_time_splits
+
+COMPARISON_FILE_NAME = "ride_comparison.parquet" if PARQUET_AVAILABLE else "ride_comparison.csv"
+COMPARISON_DTYPES = {"ID": "int64",
+                     "Year": "int16",
+                     "Weekday": "int8", #0 is Monday, 6 is Sunday
+                     "Hour": "int8",
+                     "Ride Share Duration": "float64", #minutes from request to drop off
+                     "Transit Duration": "int32", #minutes from request to arrival by public transit
+                     "Duration Ratio": "float64", #transit over ride share duration, missing when the ride share took no time
+                     "Transit Penalty": "float64", #minutes public transit takes longer than the ride share
+                     "Walking Delta": "float64", #minutes of public transit minus ride share, these three sum to the penalty
+                     "Waiting Delta": "float64",
+                     "Riding Delta": "float64"}
+COMPARISON_COLUMNS = list(COMPARISON_DTYPES)
+DELTA_COLUMNS = ["Transit Penalty", "Walking Delta", "Waiting Delta", "Riding Delta"]
+
+
+def compare_rides(ride_share_df: pd.core.frame.DataFrame, time_splits_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Joins the ride share times of rides (see ride_times.ride_share_times) with their public transit time splits.
+
+    Rides without a public transit estimate are left out."""
+    rides_df = ride_share_df.merge(time_splits_df[["ID", "Transit Duration", "Time Spent - Walking", "Time Spent - Bus", "Time Spent - Waiting"]],
+                                   on="ID", how="inner", validate="one_to_one")
+    ride_share_duration = rides_df["Walking"] + rides_df["Transit"] + rides_df["Waiting"]
+
+    return pd.DataFrame({"ID": rides_df["ID"],
+                         "Year": rides_df["Year"],
+                         "Weekday": rides_df["Weekday"],
+                         "Hour": rides_df["Hour"],
+                         "Ride Share Duration": ride_share_duration,
+                         "Transit Duration": rides_df["Transit Duration"],
+                         "Duration Ratio": (rides_df["Transit Duration"] / ride_share_duration).where(ride_share_duration > 0),
+                         "Transit Penalty": rides_df["Transit Duration"] - ride_share_duration,
+                         "Walking Delta": rides_df["Time Spent - Walking"] - rides_df["Walking"],
+                         "Waiting Delta": rides_df["Time Spent - Waiting"] - rides_df["Waiting"],
+                         "Riding Delta": rides_df["Time Spent - Bus"] - rides_df["Transit"]}).astype(COMPARISON_DTYPES)
+
+
+def summarize_comparison(comparison_df: pd.core.frame.DataFrame, by: list = None) -> pd.core.frame.DataFrame:
+    """Aggregates per ride comparisons by the given columns, e.g. ["Year", "Hour"], or over every ride when by is empty.
+
+    Gives the number of rides, mean and median duration ratio, and the mean penalty and deltas in minutes."""
+    if not by:
+        comparison_df, by = comparison_df.assign(All="All"), ["All"]
+
+    grouped = comparison_df.groupby(by)
+    summary = grouped[DELTA_COLUMNS].mean()
+    summary.insert(0, "Rides", grouped.size())
+    summary.insert(1, "Mean Duration Ratio", grouped["Duration Ratio"].mean())
+    summary.insert(2, "Median Duration Ratio", grouped["Duration Ratio"].median())
+
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarizes the per ride public transit vs ride share comparison written by main.py.")
+    parser.add_argument("--input", default=COMPARISON_FILE_NAME)
+    parser.add_argument("--by", nargs="*", default=["Year"], choices=["Year", "Weekday", "Hour"], help="columns to group rides by, none for every ride")
+    parser.add_argument("--output", help="csv file to write the summary to, it is printed otherwise")
+    args = parser.parse_args()
+
+    summary = summarize_comparison(read_time_splits(args.input, columns=COMPARISON_COLUMNS), args.by)
+    if args.output:
+        summary.to_csv(args.output)
+    else:
+        with pd.option_context("display.width", 200, "display.max_columns", None):
+            print(summary)
@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+DATA_TIMEZONE = "America/Indiana/Indianapolis" #timezone the ride export records local times in, do not change this
+
+
+def parse_distinct(column: pd.core.series.Series, format: str) -> pd.core.series.Series:
+    """Parses a column of repetitive date or time strings, converting each distinct value only once. Missing values give NaT."""
+    codes, distinct_values = pd.factorize(column.str.strip())
+    parsed = pd.to_datetime(pd.Series(distinct_values, dtype="object"), format=format).to_numpy(dtype="datetime64[ns]")
+    parsed = np.append(parsed, np.datetime64("NaT", "ns")) #factorize gives missing values the code -1, which picks this NaT
+    return pd.Series(parsed[codes], index=column.index)
+
+
+def parse_local_datetimes(date_column: pd.core.series.Series, time_column: pd.core.series.Series) -> pd.core.series.Series:
+    """Parses date (m/d/YYYY) and time (h:MMAM) columns of the ride export into wall-clock datetimes.
+
+    Exports hold at most a few hundred distinct dates and 1440 distinct times, so both are parsed separately."""
+    dates = parse_distinct(date_column, "%m/%d/%Y")
+    times_of_day = parse_distinct(time_column, "%I:%M%p") - pd.Timestamp("1900-01-01") #time-only strings parse onto 1900-01-01
+    return dates + times_of_day
+
+
+def unix_from_local(wall_clock: pd.core.series.Series) -> pd.core.series.Series:
+    """Converts wall-clock datetimes recorded in DATA_TIMEZONE into unix time, independent of the host's timezone.
+
+    Times repeated when clocks fall back are read as standard time, times skipped when clocks spring forward are moved ahead."""
+    standard_time = np.zeros(len(wall_clock), dtype=bool)
+    localized = wall_clock.dt.tz_localize(DATA_TIMEZONE, ambiguous=standard_time, nonexistent="shift_forward")
+    return (localized - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1) #google api requires whole numbers
+
+
+def shift_into_target_week(wall_clock: pd.core.series.Series, target_week: str) -> pd.core.series.Series:
+    """Moves each datetime onto the same day of the week and time of day within the week of target_week.
+
+     The accepted range for the Directions API is ~ -7days to +3 months."""
+    target_day = pd.to_datetime(target_week, format="%m/%d/%Y")
+    day_offsets = pd.to_timedelta(wall_clock.dt.weekday - target_day.weekday(), unit="D") # 0 is Monday, 6 is Sunday
+    time_of_day = wall_clock - wall_clock.dt.normalize()
+
+    return target_day + day_offsets + time_of_day
+
+
+def request_times(df: pd.core.frame.DataFrame) -> pd.core.series.Series:
+    """Unix request time of every ride in the export, as it was recorded."""
+    return unix_from_local(parse_local_datetimes(df["Request Date (Local)"], df["Request Time (Local)"]))
+
+
+def drop_off_times(df: pd.core.frame.DataFrame) -> pd.core.series.Series:
+    """Unix drop off time of every ride in the export."""
+    return unix_from_local(parse_local_datetimes(df["Drop-off Date (Local)"], df["Drop-off Time (Local)"]))
+
+
+def ride_share_total_times(df: pd.core.frame.DataFrame) -> pd.core.series.Series:
+    """Seconds between request and drop off of every ride in the export."""
+    return drop_off_times(df) - request_times(df)
+
+
+def convert_ride_times(df: pd.core.frame.DataFrame, target_week: str) -> pd.core.frame.DataFrame:
+    """Derives the timing columns of every ride in the export at once.
+
+    Request Time is moved into the target week for use with the API, or kept as recorded when target_week is None.
+    Drop-off Time is left in its original week. Ride Share - Total Time (seconds) and Hour both reflect the ride as it was recorded."""
+    request_wall_clock = parse_local_datetimes(df["Request Date (Local)"], df["Request Time (Local)"])
+    in_zone_wall_clock = request_wall_clock if target_week is None else shift_into_target_week(request_wall_clock, target_week)
+
+    drop_off_time = drop_off_times(df)
+    ride_times = pd.DataFrame({"Request Time": unix_from_local(in_zone_wall_clock),
+                               "Drop-off Time": drop_off_time,
+                               "Ride Share - Total Time": drop_off_time - unix_from_local(request_wall_clock),
+                               "Hour": request_wall_clock.dt.hour},
+                              index=df.index)
+
+    return ride_times
+
+
+def ride_share_times(df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Derives the request year, weekday and hour of every ride in the export and its ride share minutes.
+
+    Waiting is the time between request and drop off not spent in the car, ride share involves no walking."""
+    request_wall_clock = parse_local_datetimes(df["Request Date (Local)"], df["Request Time (Local)"])
+    total_minutes = (drop_off_times(df) - unix_from_local(request_wall_clock)) / 60
+
+    return pd.DataFrame({"ID": df.index.to_numpy(dtype="int64"),
+                         "Year": request_wall_clock.dt.year,
+                         "Weekday": request_wall_clock.dt.weekday,
+                         "Hour": request_wall_clock.dt.hour,
+                         "Walking": 0.0,
+                         "Transit": df["Duration (min)"],
+                         "Waiting": total_minutes - df["Duration (min)"]},
+                        index=df.index)
+
+
+def retrieve_request_time(df: pd.core.frame.DataFrame, i:int) -> int:
+    """Construct unix time from time recording in main data file. Use request_times for whole frames."""
+    return int(request_times(df.iloc[[i]]).iloc[0])
+
+
+def retrieve_drop_off_time(df: pd.core.frame.DataFrame, i:int) -> int:
+    """Construct unix time from time recording in main data file. Use drop_off_times for whole frames."""
+    return int(drop_off_times(df.iloc[[i]]).iloc[0])
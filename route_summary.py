@@ -0,0 +1,131 @@
+from concurrent.futures import ProcessPoolExecutor
+from os import cpu_count
+from os.path import isfile
+import pandas as pd
+from archive_store import decode_json, read_raw_entries
+from archive_pack import ArchivePack
+
+ROUTE_SUMMARY_FILE_NAME = "route_summary.csv"
+SUMMARIZED_MODES = ("WALKING", "TRANSIT", "DRIVING")
+PARALLEL_PARSE_THRESHOLD = 20000 #below this many entries starting worker processes costs more than it saves
+PARALLEL_CHUNK_SIZE = 1000 #entries handed to a worker process at a time
+
+SUMMARY_DTYPES = {"ID": "int64",
+                  "Archive Version": "int64",
+                  "Status": "string",
+                  "Travel Modes": "string", #sorted travel modes joined by '|', empty when no route was given
+                  "Walking Time": "int64", #seconds
+                  "Walking Distance": "int64", #meters
+                  "Transit Time": "int64",
+                  "Transit Distance": "int64",
+                  "Driving Time": "int64",
+                  "Driving Distance": "int64",
+                  "Arrival Time": "Int64", #unix time, only present for public transit directions
+                  "Leg Duration": "Int64"} #seconds
+
+
+def summarize_route(ride_id: int, version: int, api_call_results: dict) -> dict:
+    """Condenses an archived API call into a single row of the route summary table."""
+    row = {"ID": ride_id, "Archive Version": version, "Status": api_call_results["status"], "Travel Modes": "",
+           "Arrival Time": None, "Leg Duration": None}
+    for travel_mode in SUMMARIZED_MODES:
+        row[travel_mode.title() + " Time"] = 0
+        row[travel_mode.title() + " Distance"] = 0
+
+    if not api_call_results.get("routes"): #ZERO_RESULTS, UNKNOWN_ERROR and similar carry no route
+        return row
+
+    leg = api_call_results["routes"][0]["legs"][0]
+    travel_modes = set()
+    for step in leg["steps"]:
+        travel_mode = step["travel_mode"]
+        travel_modes.add(travel_mode)
+        if travel_mode in SUMMARIZED_MODES:
+            row[travel_mode.title() + " Time"] += step["duration"]["value"]
+            row[travel_mode.title() + " Distance"] += step["distance"]["value"]
+
+    row["Travel Modes"] = "|".join(sorted(travel_modes))
+    row["Leg Duration"] = leg["duration"]["value"]
+    if "arrival_time" in leg:
+        row["Arrival Time"] = leg["arrival_time"]["value"]
+
+    return row
+
+
+def summarize_entries(entries) -> list:
+    """Builds compact summary records from (ride id, version, serialized result) entries."""
+    records = []
+    for ride_id, version, body in entries:
+        row = summarize_route(ride_id, version, decode_json(body))
+        records.append(tuple(row[column] for column in SUMMARY_DTYPES))
+
+    return records
+
+
+def summarize_stored_entries(store_path: str, versions: dict, packed: bool = False) -> list:
+    """Worker process entry point, reads and summarizes the given entries straight from the store file, or the pack file when packed."""
+    if packed:
+        with ArchivePack(store_path) as archive_pack:
+            return summarize_entries((ride_id, versions[ride_id], archive_pack.get_raw(ride_id)) for ride_id in versions)
+
+    entries = ((ride_id, versions[ride_id], body) for ride_id, body in read_raw_entries(store_path, list(versions)))
+    return summarize_entries(entries)
+
+
+def summarize_in_parallel(store_path: str, versions: dict, workers: int = None, packed: bool = False) -> list:
+    """Spreads summarizing of the given entries across a pool of worker processes."""
+    ride_ids = sorted(versions)
+    chunks = [{ride_id: versions[ride_id] for ride_id in ride_ids[start:start + PARALLEL_CHUNK_SIZE]}
+              for start in range(0, len(ride_ids), PARALLEL_CHUNK_SIZE)]
+
+    records = []
+    with ProcessPoolExecutor(max_workers=workers or cpu_count()) as executor:
+        for chunk_records in executor.map(summarize_stored_entries, [store_path] * len(chunks), chunks, [packed] * len(chunks)):
+            records.extend(chunk_records)
+
+    return records
+
+
+def records_to_frame(records: list) -> pd.core.frame.DataFrame:
+    """Turns summary records into a typed route summary table."""
+    return pd.DataFrame.from_records(records, columns=list(SUMMARY_DTYPES)).astype(SUMMARY_DTYPES)
+
+
+def load_route_summary(archive_store, cache_path: str = ROUTE_SUMMARY_FILE_NAME, workers: int = 1) -> pd.core.frame.DataFrame:
+    """Retrieves the route summary of every archived ride, held in memory as a whole table.
+
+    The table is cached on disk alongside the archive version of every row, so only entries added or rewritten
+    since the last run are parsed again. With workers other than 1 (None uses every core), large batches of entries
+    are parsed in worker processes; the resulting table is identical to parsing them here. The archive can be an
+    ArchiveStore or an ArchivePack."""
+    versions = archive_store.versions()
+
+    cache_is_current = isfile(cache_path)
+    if cache_is_current:
+        cached = pd.read_csv(cache_path, dtype=SUMMARY_DTYPES, keep_default_na=False, na_values={"Arrival Time": [""], "Leg Duration": [""]})
+        current = cached["Archive Version"] == cached["ID"].map(versions)
+        cache_is_current = bool(current.all())
+        cached = cached[current]
+    else:
+        cached = records_to_frame([])
+
+    cached_ids = set(cached["ID"])
+    stale_ids = [ride_id for ride_id in versions if ride_id not in cached_ids]
+    if cache_is_current and not stale_ids:
+        return cached.reset_index(drop=True)
+
+    if workers != 1 and len(stale_ids) >= PARALLEL_PARSE_THRESHOLD:
+        records = summarize_in_parallel(archive_store.path, {ride_id: versions[ride_id] for ride_id in stale_ids}, workers,
+                                        isinstance(archive_store, ArchivePack))
+    else:
+        records = summarize_entries((ride_id, versions[ride_id], archive_store.get_raw(ride_id)) for ride_id in stale_ids)
+    fresh = records_to_frame(records)
+    summary = pd.concat([cached, fresh], ignore_index=True).sort_values("ID", ignore_index=True)
+    summary.to_csv(cache_path, index=False)
+
+    return summary
+
+
+def has_travel_mode(summary: pd.core.frame.DataFrame, travel_mode: str) -> pd.core.series.Series:
+    """Flags the summary rows whose route uses the given travel mode."""
+    return ("|" + summary["Travel Modes"] + "|").str.contains(f"|{travel_mode}|", regex=False)
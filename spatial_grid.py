@@ -0,0 +1,100 @@
+import argparse
+import numpy as np
+import pandas as pd
+from ride_times import ride_share_total_times
+from time_splits_io import read_time_splits
+
+TIME_SPLITS_FILE_NAME = "time_splits.parquet" #output of main.py, csv also works
+RIDES_FILE_PATH = "epp_data.csv"
+GRID_FILE_NAME = "spatial_grid.csv"
+GRID_CELL_SIZE = 0.005 #degrees, about 550 m north-south and 400 m east-west around South Bend
+CHUNK_SIZE = 100000 #rides read from the export at a time
+
+ENDPOINTS = {"Pickup": ("Pickup Latitude", "Pickup Longitude"),
+             "Drop Off": ("Drop Off Latitude", "Drop Off Longitude")}
+EXPORT_DTYPES = {"Request Date (Local)": "string",
+                 "Request Time (Local)": "string",
+                 "Drop-off Date (Local)": "string",
+                 "Drop-off Time (Local)": "string",
+                 "Pickup Latitude": "float64",
+                 "Pickup Longitude": "float64",
+                 "Drop Off Latitude": "float64",
+                 "Drop Off Longitude": "float64"}
+GRID_KEYS = ["Endpoint", "Cell Row", "Cell Column"]
+
+
+def grid_cells(latitudes: pd.core.series.Series, longitudes: pd.core.series.Series, cell_size: float = GRID_CELL_SIZE) -> tuple:
+    """Row and column of the fixed grid cell holding each coordinate. Cells are anchored at 0,0 so grids of the same size line up."""
+    return np.floor(latitudes / cell_size).astype("int64"), np.floor(longitudes / cell_size).astype("int64")
+
+
+def ride_durations(export_df: pd.core.frame.DataFrame, time_splits_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Joins rides of the export with their public transit estimate and derives the transit to ride share duration ratio.
+
+    Rides without an estimate are dropped, rides without a positive ride share duration get no ratio."""
+    rides_df = export_df.join(time_splits_df.set_index("ID")["Transit Duration"], how="inner")
+    ride_share_minutes = ride_share_total_times(rides_df) / 60
+    rides_df["Duration Ratio"] = (rides_df["Transit Duration"] / ride_share_minutes).where(ride_share_minutes > 0)
+
+    return rides_df
+
+
+def aggregate_grid(rides_df: pd.core.frame.DataFrame, cell_size: float = GRID_CELL_SIZE) -> pd.core.frame.DataFrame:
+    """Sums transit durations and ratios of rides per grid cell, separately for pickups and drop offs."""
+    sums = []
+    for endpoint, (latitude_column, longitude_column) in ENDPOINTS.items():
+        located = rides_df.dropna(subset=[latitude_column, longitude_column])
+        rows, columns = grid_cells(located[latitude_column], located[longitude_column], cell_size)
+        cells = pd.DataFrame({"Endpoint": endpoint,
+                              "Cell Row": rows,
+                              "Cell Column": columns,
+                              "Transit Duration": located["Transit Duration"],
+                              "Duration Ratio": located["Duration Ratio"].fillna(0),
+                              "Ratio Rides": located["Duration Ratio"].notna()})
+        grouped = cells.groupby(GRID_KEYS)
+        endpoint_sums = grouped[["Transit Duration", "Duration Ratio", "Ratio Rides"]].sum()
+        endpoint_sums.insert(0, "Rides", grouped.size())
+        sums.append(endpoint_sums)
+
+    return pd.concat(sums)
+
+
+def finish_grid(sums: pd.core.frame.DataFrame, cell_size: float = GRID_CELL_SIZE) -> pd.core.frame.DataFrame:
+    """Turns per cell sums into the mapping table: cell center, ride count, mean transit duration and mean ratio."""
+    grid_df = sums.reset_index()
+    return pd.DataFrame({"Endpoint": grid_df["Endpoint"],
+                         "Cell Row": grid_df["Cell Row"],
+                         "Cell Column": grid_df["Cell Column"],
+                         "Latitude": (grid_df["Cell Row"] + 0.5) * cell_size, #cell center
+                         "Longitude": (grid_df["Cell Column"] + 0.5) * cell_size,
+                         "Rides": grid_df["Rides"],
+                         "Mean Transit Duration": grid_df["Transit Duration"] / grid_df["Rides"], #minutes
+                         "Mean Duration Ratio": grid_df["Duration Ratio"] / grid_df["Ratio Rides"].where(grid_df["Ratio Rides"] > 0)})
+
+
+def build_spatial_grid(time_splits_path: str = TIME_SPLITS_FILE_NAME, rides_path: str = RIDES_FILE_PATH,
+                       cell_size: float = GRID_CELL_SIZE, chunk_size: int = CHUNK_SIZE) -> pd.core.frame.DataFrame:
+    """Aggregates every ride with a public transit estimate into grid cells by pickup and by drop off location.
+
+    The export is streamed in chunks of chunk_size rides, ride ids are row positions as in main.py."""
+    time_splits_df = read_time_splits(time_splits_path, columns=["ID", "Transit Duration"])
+    partial_sums = []
+    with pd.read_csv(rides_path, usecols=list(EXPORT_DTYPES), dtype=EXPORT_DTYPES, chunksize=chunk_size) as chunks:
+        for chunk in chunks:
+            partial_sums.append(aggregate_grid(ride_durations(chunk, time_splits_df), cell_size))
+
+    sums = pd.concat(partial_sums).groupby(GRID_KEYS).sum()
+    return finish_grid(sums, cell_size).sort_values(GRID_KEYS, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bins pickup and drop off locations into a grid of transit estimates for mapping.")
+    parser.add_argument("--time-splits", default=TIME_SPLITS_FILE_NAME, help="time splits output of main.py")
+    parser.add_argument("--rides", default=RIDES_FILE_PATH, help="ride export the time splits were computed from")
+    parser.add_argument("--cell-size", type=float, default=GRID_CELL_SIZE, help="grid cell size in degrees")
+    parser.add_argument("--output", default=GRID_FILE_NAME)
+    args = parser.parse_args()
+
+    spatial_grid = build_spatial_grid(args.time_splits, args.rides, args.cell_size)
+    spatial_grid.to_csv(args.output, index=False)
+    print(len(spatial_grid), "grid cells written to", args.output)
@@ -1,33 +1,23 @@
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-import pandas as pd
-from main import retrieve_request_time, retrieve_drop_off_time
+from aggregate_cube import CUBE_FILE_NAME, load_cube, cube_means
 
-BUS_DATA_FILE_NAME = "filename.csv"
-CT_DATA_FILENAME = "epp_data.csv"
 OUTPUT_FILE_NAME = "image.png"
 
 
-if __name__ == "__main__":
+def render_stacked_bar_chart(cube_file_name: str = CUBE_FILE_NAME, output_file_name: str = OUTPUT_FILE_NAME):
+    """Draws the average walking, waiting and transit minutes of ride share and public transit trips as stacked bars."""
     ### Data Processing ###
-    # read data from file
-    transit_data = pd.read_csv(BUS_DATA_FILE_NAME)
-    rideshare_data = pd.read_csv(CT_DATA_FILENAME)
+    # read the aggregate cube written by main.py, it holds summed minutes and ride counts
+    cube = load_cube(cube_file_name)
 
     # calculations
-    rideshare_data["Ride Share - Total Time"] = [retrieve_drop_off_time(rideshare_data, i) - retrieve_request_time(rideshare_data, i) for i, entry in rideshare_data.iterrows() ] #time difference is in seconds, utilizes helper function from main file
-
-    average_transpo_walking_time = transit_data["Time Spent - Walking"].mean()
-    average_transit_time = transit_data["Time Spent - Bus"].mean()
-    average_transpo_waiting_time = transit_data["Time Spent - Waiting"].mean()
-
-    average_rideshare_transit_time = rideshare_data["Duration (min)"].mean()
-    average_rideshare_waiting_time = (rideshare_data["Ride Share - Total Time"].mean() - average_rideshare_transit_time)/60
+    averageTimes = cube_means(cube, ["Method"])
 
     #data grouping
-    publicTransportData = {"Transit": average_transit_time, "Waiting": average_transpo_waiting_time, "Walking": average_transpo_walking_time} #<2 hr commute time
-    rideShareData = {"Transit": average_rideshare_transit_time, "Waiting": average_rideshare_waiting_time, "Walking": 0}
+    publicTransportData = averageTimes.loc["Public Transit"].to_dict()
+    rideShareData = averageTimes.loc["Ride Share"].to_dict()
 
     ### Layer Creation ###
     #Top Layer (All three times)
@@ -59,5 +49,9 @@ if __name__ == "__main__":
     plt.ylabel("Minutes")
     plt.xlabel("Transportation Method")
 
-    plt.savefig(OUTPUT_FILE_NAME)
-    plt.show()
\ No newline at end of file
+    plt.savefig(output_file_name)
+
+
+if __name__ == "__main__":
+    render_stacked_bar_chart()
+    plt.show()
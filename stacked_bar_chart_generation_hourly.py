@@ -1,26 +1,20 @@
 import seaborn as sns
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
-import pandas as pd
+from aggregate_cube import CUBE_FILE_NAME, load_cube, cube_means
 
-BUS_DATA_FILE_NAME = "filename.csv"
 OUTPUT_FILE_NAME = "image.png"
 
 
-if __name__ == "__main__":
+def render_hourly_stacked_bar_chart(cube_file_name: str = CUBE_FILE_NAME, output_file_name: str = OUTPUT_FILE_NAME):
+    """Draws the average walking, waiting and bus minutes of public transit trips for each hour as stacked bars."""
     ### Data Processing ###
-    # read data from file
-    data = pd.read_csv(BUS_DATA_FILE_NAME)
+    # read the aggregate cube written by main.py, it holds summed minutes and ride counts
+    cube = load_cube(cube_file_name)
 
     # calculations
-    byHour = {hour: df for hour, df in data.groupby("Hour")}
-    averageTimes = {}
-    for hour in byHour:
-        averageTimes[hour] = {
-            "Walking": byHour[hour]["Time Spent - Walking"].mean(),
-            "Bus": byHour[hour]["Time Spent - Bus"].mean(),
-            "Waiting": byHour[hour]["Time Spent - Waiting"].mean()
-        }
+    averageTimes = cube_means(cube[cube["Method"] == "Public Transit"], ["Hour"]).reindex(range(24))
+    averageTimes = averageTimes.rename(columns={"Transit": "Bus"}).to_dict("index")
 
     ### Layer Creation ###
     # Bottom Layer
@@ -52,5 +46,9 @@ if __name__ == "__main__":
     plt.ylabel("Minutes")
     plt.xlabel("Hour")
 
-    plt.savefig(OUTPUT_FILE_NAME)
-    plt.show()
\ No newline at end of file
+    plt.savefig(output_file_name)
+
+
+if __name__ == "__main__":
+    render_hourly_stacked_bar_chart()
+    plt.show()
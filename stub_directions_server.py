@@ -0,0 +1,96 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from benchmark import RESPONSE_KINDS, RESPONSE_WEIGHTS, generate_directions_response
+
+STUB_PORT = 8765 #set main.API_BASE_URL to http://127.0.0.1:8765/ to fetch from the stub
+
+
+class StubDirectionsServer(ThreadingHTTPServer):
+    """Local stand-in for the Directions API answering with synthetic responses and injected failures.
+
+    Each request independently fails at the configured rates: an UNKNOWN_ERROR or OVER_QUERY_LIMIT response,
+    an HTTP 500, or no answer within hang seconds. Requests and failures are counted by kind."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int = STUB_PORT, unknown_error_rate: float = 0, over_query_limit_rate: float = 0,
+                 server_error_rate: float = 0, hang_rate: float = 0, hang: float = 60, seed: int = 0):
+        super().__init__(("127.0.0.1", port), StubDirectionsHandler)
+        self.failure_rates = {"UNKNOWN_ERROR": unknown_error_rate, "OVER_QUERY_LIMIT": over_query_limit_rate,
+                              "server_error": server_error_rate, "hang": hang_rate}
+        self.hang = hang
+        self.counts = {"requests": 0, **{failure: 0 for failure in self.failure_rates}}
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def draw(self, request_time: int) -> tuple:
+        """Picks the failure injected into a request, None for a normal answer, and the response it would otherwise get."""
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._rng.random()
+            response = generate_directions_response(self._rng, self._rng.choice(RESPONSE_KINDS, p=RESPONSE_WEIGHTS), request_time)
+            for failure, rate in self.failure_rates.items():
+                if roll < rate:
+                    self.counts[failure] += 1
+                    return failure, response
+                roll -= rate
+
+        return None, response
+
+    def handle_error(self, request, client_address):
+        """Reports errors while answering, except clients that gave up on a hanging request before it was answered."""
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StubDirectionsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        failure, response = self.server.draw(int(query.get("departure_time", ["0"])[0]))
+        if failure == "hang":
+            time.sleep(self.server.hang)
+        if failure == "server_error":
+            self.send_error(500)
+            return
+        if failure in ("UNKNOWN_ERROR", "OVER_QUERY_LIMIT"):
+            response = {"geocoded_waypoints": [], "routes": [], "status": failure}
+
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): #keeps request lines out of the console
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves synthetic Directions API responses locally, injecting failures to exercise the fetcher.")
+    parser.add_argument("--port", type=int, default=STUB_PORT)
+    parser.add_argument("--unknown-error-rate", type=float, default=0.05, help="share of requests answered with UNKNOWN_ERROR")
+    parser.add_argument("--over-query-limit-rate", type=float, default=0.05, help="share of requests answered with OVER_QUERY_LIMIT")
+    parser.add_argument("--server-error-rate", type=float, default=0.02, help="share of requests answered with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.01, help="share of requests left unanswered for --hang seconds")
+    parser.add_argument("--hang", type=float, default=60, help="seconds a hanging request waits, longer than main.FETCH_TIMEOUT times it out")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubDirectionsServer(args.port, args.unknown_error_rate, args.over_query_limit_rate, args.server_error_rate,
+                                  args.hang_rate, args.hang, args.seed)
+    print("Serving synthetic directions on", f"http://127.0.0.1:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(server.counts)
@@ -1,50 +1,89 @@
+import re
+import numpy as np
 import pandas as pd
 
 TEMP_INPUT_NAME = "temp_transit_duration"
 RIDES_FILE_NAME = "EPP_Uber_Rides_2024"
 
+UNIT_MINUTES = {"day": 60 * 24, "hour": 60, "min": 1} #units of Google's duration text, e.g. "1 hour 5 mins"
+DURATION_COMPONENT = re.compile(r"(\d+) (day|hour|min)s?")
+ENDPOINTS = {"start": ("Pickup Latitude", "Pickup Longitude"),
+             "end": ("Drop Off Latitude", "Drop Off Longitude")}
+
 
 def fix_time(time: str) -> int:
+    """Converts a duration text such as "1 day 2 hours" or "1 hour 5 mins" into minutes."""
+    components = time.split()
+    if len(components) == 0 or len(components) % 2 != 0:
+        raise ValueError(f"invalid duration {time!r}, expected pairs of a number and a unit")
+
     total_time = 0
-    components = time.split(" ")
-    for i in range(0,len(components),2):
-        pair = components[i:i+2]
-        if "day" in pair[1]:
-            total_time += 60 * 24 * int(pair[0])
-        elif "hour" in pair[1]:
-            total_time += 60 * int(pair[0])
-        elif "min" in pair[1]:
-            total_time += int(pair[0])
-        else:
-            raise "invalid time type. investigate"
+    for i in range(0, len(components), 2):
+        component = DURATION_COMPONENT.fullmatch(" ".join(components[i:i + 2]))
+        if component is None:
+            raise ValueError(f"invalid duration {time!r}, {' '.join(components[i:i + 2])!r} is not a number of days, hours or mins")
+        total_time += UNIT_MINUTES[component[2]] * int(component[1])
 
     return total_time
 
 
-if __name__ == "__main__":
-    tempDF = pd.read_csv(TEMP_INPUT_NAME + ".csv")
-    eppDF = pd.read_csv(RIDES_FILE_NAME + ".csv")
+def parse_durations(column: pd.core.series.Series) -> pd.core.series.Series:
+    """Converts a column of duration texts into minutes, converting each distinct text only once.
+
+    Every unparsable text is reported at once, along with the number of rows holding it."""
+    if column.isna().any():
+        raise ValueError(f"{int(column.isna().sum())} rows have no duration")
+
+    codes, distinct_values = pd.factorize(column.str.strip())
+    minutes = np.zeros(len(distinct_values), dtype="int64")
+    errors = []
+    for i, time in enumerate(distinct_values):
+        try:
+            minutes[i] = fix_time(time)
+        except ValueError as error:
+            errors.append(f"{error} ({int((codes == i).sum())} rows)")
+
+    if errors:
+        raise ValueError("unparsable durations:\n" + "\n".join(errors))
+
+    return pd.Series(minutes[codes], index=column.index)
 
-    start_data = {"ID": [], "Latitude": [], "Longitude": [], "Public Transit Duration": []}
-    end_data = {"ID": [], "Latitude": [], "Longitude": [], "Public Transit Duration": []}
 
-    start_data["ID"] = tempDF["ID"]
-    end_data["ID"] = tempDF["ID"]
-    for i, google_row in tempDF.iterrows():
-        id = google_row["ID"]
-        epp_row = eppDF.iloc[id]
+def join_rides(temp_df: pd.core.frame.DataFrame, epp_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Joins each temp duration to the coordinates of its ride, ride IDs being row positions in the EPP export."""
+    ride_ids = temp_df["ID"].to_numpy()
+    unknown_ids = ride_ids[(ride_ids < 0) | (ride_ids >= len(epp_df))]
+    if len(unknown_ids) > 0:
+        raise ValueError(f"{len(unknown_ids)} ride IDs are not in the EPP export, e.g. {unknown_ids[:5].tolist()}")
 
-        start_data["Latitude"].append(epp_row["Pickup Latitude"])
-        start_data["Longitude"].append(epp_row["Pickup Longitude"])
-        start_data["Public Transit Duration"].append(fix_time(google_row["Time"]))
+    coordinates = epp_df.iloc[ride_ids].reset_index(drop=True)
+    coordinates.insert(0, "ID", ride_ids)
+    coordinates["Public Transit Duration"] = parse_durations(temp_df["Time"]).to_numpy()
+    return coordinates
 
-        end_data["Latitude"].append(epp_row["Drop Off Latitude"])
-        end_data["Longitude"].append(epp_row["Drop Off Longitude"])
-        end_data["Public Transit Duration"].append(fix_time(google_row["Time"]))
 
+def coordinate_tables(rides_df: pd.core.frame.DataFrame) -> dict:
+    """Splits joined rides into the start and end coordinate tables, keyed by endpoint."""
+    return {endpoint: rides_df[["ID", latitude_column, longitude_column, "Public Transit Duration"]]
+                      .rename(columns={latitude_column: "Latitude", longitude_column: "Longitude"})
+            for endpoint, (latitude_column, longitude_column) in ENDPOINTS.items()}
 
-    start_coords_df = pd.DataFrame(start_data)
-    end_coords_df = pd.DataFrame(end_data)
 
-    start_coords_df.to_csv(TEMP_INPUT_NAME + "_start_coords.csv")
-    end_coords_df.to_csv(TEMP_INPUT_NAME + "_end_coords.csv")
\ No newline at end of file
+def coordinate_file_names(temp_input_name: str = TEMP_INPUT_NAME) -> dict:
+    """Files the coordinate tables are written to, keyed by endpoint."""
+    return {endpoint: f"{temp_input_name}_{endpoint}_coords.csv" for endpoint in ENDPOINTS}
+
+
+def process_temp_durations(temp_input_name: str = TEMP_INPUT_NAME, rides_file_name: str = RIDES_FILE_NAME):
+    """Reads the temp durations and the EPP export, then writes the start and end coordinate tables."""
+    tempDF = pd.read_csv(temp_input_name + ".csv", usecols=["ID", "Time"], dtype={"ID": "int64", "Time": "string"})
+    coordinate_columns = [column for columns in ENDPOINTS.values() for column in columns]
+    eppDF = pd.read_csv(rides_file_name + ".csv", usecols=coordinate_columns, dtype=dict.fromkeys(coordinate_columns, "float64"))
+
+    file_names = coordinate_file_names(temp_input_name)
+    for endpoint, coords_df in coordinate_tables(join_rides(tempDF, eppDF)).items():
+        coords_df.to_csv(file_names[endpoint])
+
+
+if __name__ == "__main__":
+    process_temp_durations()
@@ -0,0 +1,12 @@
+import pytest
+import main
+
+
+@pytest.fixture
+def main_in_tmp_path(tmp_path, monkeypatch):
+    """main.py running in an empty working directory, its stores are closed afterwards."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "PARSE_WORKERS", 1)
+    main.close_stores()
+    yield main
+    main.close_stores()
@@ -0,0 +1,101 @@
+import json
+from os import remove
+import pandas as pd
+import pytest
+import route_summary
+from archive_pack import ArchivePack, pack_archive, write_pack
+from archive_store import ArchiveStore
+from benchmark import generate_ride_export
+from route_summary import load_route_summary
+from test_incremental_pipeline import CHUNK_SIZE, read_outputs, write_rides
+from test_route_summary import archive
+
+RIDE_IDS = list(range(0, 600, 3)) #gaps between ids, so lookups between packed ids miss
+
+
+@pytest.fixture
+def packed(tmp_path):
+    """An archive store and a pack of it with blocks far smaller than an entry, so entries span block boundaries."""
+    archive_store = archive(str(tmp_path / "archive.sqlite"), RIDE_IDS)
+    pack_archive(archive_store.path, str(tmp_path / "archive.pack"), block_size=100)
+    archive_pack = ArchivePack(str(tmp_path / "archive.pack"))
+    yield archive_store, archive_pack
+    archive_pack.close()
+    archive_store.close()
+
+
+def test_pack_round_trips_every_entry(packed):
+    archive_store, archive_pack = packed
+    assert len(archive_pack) == len(RIDE_IDS)
+    assert archive_pack.ids() == archive_store.ids()
+    assert archive_pack.versions() == archive_store.versions()
+    for ride_id in reversed(RIDE_IDS): #backwards, so no lookup is served by the block of the previous one
+        assert archive_pack.get_raw(ride_id) == archive_store.get_raw(ride_id)
+        assert archive_pack.get(ride_id) == archive_store.get(ride_id)
+
+
+def test_pack_misses_unpacked_ids(packed):
+    archive_store, archive_pack = packed
+    for ride_id in (-1, 1, 599, 600, 10 ** 9):
+        assert ride_id not in archive_pack
+        with pytest.raises(KeyError):
+            archive_pack.get_raw(ride_id)
+
+
+def test_pack_scans_in_id_order(packed):
+    archive_store, archive_pack = packed
+    assert list(archive_pack.iter_raw()) == list(archive_store.iter_raw())
+    assert [ride_id for ride_id, version, body in archive_pack.iter_raw()] == RIDE_IDS
+
+
+def test_empty_pack(tmp_path):
+    assert write_pack([], str(tmp_path / "empty.pack")) == 0
+    with ArchivePack(str(tmp_path / "empty.pack")) as archive_pack:
+        assert len(archive_pack) == 0
+        assert 0 not in archive_pack
+        assert archive_pack.ids() == frozenset() and archive_pack.versions() == {}
+        assert list(archive_pack.iter_raw()) == []
+        with pytest.raises(KeyError):
+            archive_pack.get(0)
+
+
+def test_pack_entries_must_be_sorted(tmp_path):
+    with pytest.raises(ValueError):
+        write_pack([(2, 0, json.dumps({})), (1, 0, json.dumps({}))], str(tmp_path / "unsorted.pack"))
+
+
+def test_parallel_summary_of_pack_matches_store(packed, tmp_path, monkeypatch):
+    monkeypatch.setattr(route_summary, "PARALLEL_PARSE_THRESHOLD", 1)
+    monkeypatch.setattr(route_summary, "PARALLEL_CHUNK_SIZE", 7)
+    archive_store, archive_pack = packed
+    from_store = load_route_summary(archive_store, str(tmp_path / "store.csv"), workers=1)
+    from_pack = load_route_summary(archive_pack, str(tmp_path / "pack.csv"), workers=3)
+
+    pd.testing.assert_frame_equal(from_pack, from_store)
+
+
+def test_pipeline_reads_pack_like_store(main_in_tmp_path, monkeypatch):
+    main = main_in_tmp_path
+    write_rides(main, generate_ride_export(200))
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE)
+    from_store = read_outputs(main)
+    pack_archive(main.get_archive_store().path, "archive.pack")
+    main.close_stores()
+    remove(main.ROUTE_SUMMARY_FILE_NAME) #every summary is parsed again, from the pack
+
+    monkeypatch.setattr(main, "ARCHIVE_PACK_PATH", "archive.pack")
+    main.run_pipeline(None, full_rebuild=True, chunk_size=CHUNK_SIZE)
+    from_pack = read_outputs(main)
+
+    assert isinstance(main.get_archive_store(), ArchivePack)
+    with ArchiveStore(main.ARCHIVE_STORE_PATH) as archive_store:
+        assert main.load_json_by_id(5) == archive_store.get(5)
+    for name in from_store:
+        pd.testing.assert_frame_equal(from_pack[name], from_store[name])
+
+
+def test_fetching_needs_the_store(main_in_tmp_path, monkeypatch):
+    main = main_in_tmp_path
+    monkeypatch.setattr(main, "ARCHIVE_PACK_PATH", "archive.pack")
+    with pytest.raises(ValueError):
+        main.fetch_new_rides(None)
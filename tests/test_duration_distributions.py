@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+from duration_distributions import HISTOGRAM_MINUTES, MEASURES, DurationDistribution, MinuteHistogram, load_distributions
+
+
+def time_splits(rows: int, seed: int = 0) -> pd.core.frame.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({measure: rng.integers(0, 200, rows).astype("float64") for measure in MEASURES})
+    df.loc[:2, "Transit Duration"] = [-5, HISTOGRAM_MINUTES + 1, 3 * HISTOGRAM_MINUTES + 0.5] #outside the dense bins
+    return df
+
+
+def test_histogram_counts_every_row():
+    df = time_splits(10002)
+    distribution = DurationDistribution()
+    distribution.add(df)
+
+    for measure in MEASURES:
+        values, counts = distribution.histograms[measure].values_and_counts()
+        assert counts.sum() == len(df)
+        assert (np.diff(values) > 0).all()
+
+    values, counts = distribution.histograms["Transit Duration"].values_and_counts()
+    assert {-5, HISTOGRAM_MINUTES + 1, 3 * HISTOGRAM_MINUTES} <= set(values.tolist())
+
+
+def test_trimmed_histogram_matches_filtered_rows():
+    df = time_splits(5000)
+    histogram = MinuteHistogram()
+    histogram.add(df["Transit Duration"].to_numpy())
+
+    values, counts = histogram.values_and_counts(100)
+    assert counts.sum() == (np.floor(df["Transit Duration"]) <= 100).sum()
+
+
+def test_merged_and_persisted_histograms_keep_every_row(tmp_path):
+    first, second = time_splits(3000, seed=1), time_splits(4000, seed=2)
+    paths = [tmp_path / "first.csv", tmp_path / "second.csv"]
+    first.to_csv(paths[0], index=False)
+    second.to_csv(paths[1], index=False)
+
+    distributions_path = str(tmp_path / "distributions.json")
+    load_distributions([str(path) for path in paths], distributions_path)
+    reloaded = load_distributions([str(path) for path in paths], distributions_path)
+
+    combined = DurationDistribution()
+    for distribution in reloaded.values():
+        combined.merge(distribution)
+    assert combined.histograms["Transit Duration"].count == len(first) + len(second)
+    assert combined.histograms["Transit Duration"].values_and_counts()[1].sum() == len(first) + len(second)
@@ -0,0 +1,113 @@
+import threading
+from functools import partial
+import pytest
+import requests
+from benchmark import generate_ride_export
+from fetch_queue import FetchQueue
+from stub_directions_server import StubDirectionsServer
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def stub_server():
+    """Directions API stand-in on a free port, failing a fifth of the requests in every way it can."""
+    server = StubDirectionsServer(port=0, unknown_error_rate=0.05, over_query_limit_rate=0.05, server_error_rate=0.05,
+                                  hang_rate=0.05, hang=1, seed=1)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def fetching_main(main_in_tmp_path, stub_server, monkeypatch):
+    """main.py fetching from the stub server quickly, with short timeouts and backoffs and enough attempts for every ride."""
+    main = main_in_tmp_path
+    monkeypatch.setattr(main, "API_BASE_URL", f"http://127.0.0.1:{stub_server.server_address[1]}/")
+    monkeypatch.setattr(main, "ROUTER", "google")
+    monkeypatch.setattr(main, "API_CALL_RATE", 1000)
+    monkeypatch.setattr(main, "FETCH_TIMEOUT", 0.3)
+    monkeypatch.setattr(main, "FETCH_MAX_ATTEMPTS", 50)
+    monkeypatch.setattr(main, "FetchQueue", partial(FetchQueue, backoff_base=0.01, backoff_cap=0.05))
+    return main
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_interrupted_fetch_resumes_until_every_ride_is_archived(fetching_main, stub_server, monkeypatch, concurrent):
+    main = fetching_main
+    monkeypatch.setattr(main, "CONCURRENT_FETCH", concurrent)
+    monkeypatch.setattr(main, "FETCH_WORKERS", 4)
+    generate_ride_export(80).to_csv(main.RIDES_FILE_PATH, index=False)
+
+    record_api_call_result = main.record_api_call_result
+    recorded = []
+
+    def record_until_interrupted(*args):
+        if len(recorded) == 20:
+            raise Interrupted()
+        recorded.append(args)
+        record_api_call_result(*args)
+
+    monkeypatch.setattr(main, "record_api_call_result", record_until_interrupted)
+    with pytest.raises(Interrupted):
+        main.fetch_new_rides(None)
+    assert len(main.get_fetch_queue()) > 0
+    main.close_stores() #the next run starts afresh from the files left behind
+
+    monkeypatch.setattr(main, "record_api_call_result", record_api_call_result)
+    main.fetch_new_rides(None)
+
+    assert main.get_archive_store().ids() == frozenset(range(80))
+    assert len(main.get_fetch_queue()) == 0
+    assert "request_failed" not in main.get_failure_log().counts()
+    assert sum(stub_server.counts[failure] for failure in stub_server.failure_rates) > 0
+
+
+def http_error(status_code: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(f"{status_code} error", response=response)
+
+
+@pytest.mark.parametrize("error, retried", [(http_error(500), True), (http_error(503), True), (http_error(429), True),
+                                            (requests.Timeout(), True), (requests.ConnectionError(), True),
+                                            (http_error(400), False), (http_error(403), False), (http_error(404), False)])
+def test_only_transient_failures_are_retried(main_in_tmp_path, error, retried):
+    main = main_in_tmp_path
+    fetch_queue = main.get_fetch_queue()
+    ride = {"ID": 7, "Start": (41.6, -86.2), "End": (41.7, -86.3), "Request Time": 1700000000}
+    fetch_queue.enqueue([(ride, [])])
+    fetch_queue.claim_due(1)
+
+    def result():
+        raise error
+
+    main.settle_api_call(fetch_queue, ride, [], "url", result)
+
+    assert len(fetch_queue) == (1 if retried else 0)
+    assert main.get_failure_log().failed_ids({"request_failed"}) == (set() if retried else {7})
+
+
+def test_known_failures_are_skipped_before_prescreening(main_in_tmp_path):
+    main = main_in_tmp_path
+    rides_df = generate_ride_export(20)
+    rides_df.loc[3, ["Drop Off Latitude", "Drop Off Longitude"]] = rides_df.loc[3, ["Pickup Latitude", "Pickup Longitude"]].to_numpy()
+    rides_df.loc[5, ["Drop Off Latitude", "Drop Off Longitude"]] = rides_df.loc[5, ["Pickup Latitude", "Pickup Longitude"]].to_numpy() + [0.001, 0]
+    rides_df.to_csv(main.RIDES_FILE_PATH, index=False)
+    chunk = next(main.read_ride_export(main.RIDES_FILE_PATH, None))
+
+    counters = []
+    for run in range(2):
+        main.METRICS.reset()
+        fetch_plan = main.FetchPlan()
+        fetch_plan.add_chunk(chunk, [], main.empty_manifest())
+        assert {ride["ID"] for ride, shared_ids in fetch_plan.calls()} == set(range(20)) - {3, 5}
+        counters.append(dict(main.METRICS.counters))
+
+    assert counters[0]["bad_coordinates"] == 1 and counters[0]["archived"] == 1 and counters[0]["prescreened_walking"] == 1
+    assert "bad_coordinates" not in counters[1] and counters[1]["skipped_known_failure"] == 1 and counters[1]["skipped"] == 1
+    assert main.get_failure_log().failed_ids() == {3} and 5 in main.get_archive_store()
@@ -0,0 +1,52 @@
+from os.path import dirname, join
+import pandas as pd
+import pytest
+from gtfs_router import TransitRouter
+
+FIXTURE_FEED = join(dirname(__file__), "fixtures", "gtfs")
+NEAR_A = (41.6500, -86.3005) #about 40 meters west of each stop
+NEAR_B = (41.6500, -86.2495)
+NEAR_C = (41.6510, -86.2495)
+NEAR_D = (42.0000, -86.2495)
+
+
+@pytest.fixture(scope="module")
+def router():
+    return TransitRouter(FIXTURE_FEED)
+
+
+def departing(router, local_time: str) -> int:
+    return int(pd.Timestamp(local_time).tz_localize(router.timezone).timestamp())
+
+
+def transit_steps(response: dict) -> list:
+    assert response["status"] == "OK"
+    return [step for step in response["routes"][0]["legs"][0]["steps"] if step["travel_mode"] == "TRANSIT"]
+
+
+def test_transfer_route(router):
+    response = router.route(NEAR_A, NEAR_D, departing(router, "2024-03-05 07:50"))
+    steps = transit_steps(response)
+    assert [step["transit_details"]["trip_id"] for step in steps] == ["R1_0800", "R2_0820"]
+    assert [step["travel_mode"] for step in response["routes"][0]["legs"][0]["steps"]] == ["WALKING", "TRANSIT", "WALKING", "TRANSIT", "WALKING"]
+
+    leg = response["routes"][0]["legs"][0]
+    assert leg["arrival_time"]["value"] > departing(router, "2024-03-05 09:05")
+    assert leg["duration"]["value"] == leg["arrival_time"]["value"] - departing(router, "2024-03-05 07:50")
+
+
+def test_trip_of_previous_service_day_after_midnight(router):
+    steps = transit_steps(router.route(NEAR_A, NEAR_B, departing(router, "2024-03-06 00:05")))
+    assert [step["transit_details"]["trip_id"] for step in steps] == ["R1_2410"]
+    assert steps[0]["transit_details"]["departure_time"]["value"] == departing(router, "2024-03-06 00:10")
+
+
+def test_late_request_takes_first_trip_of_next_day(router):
+    steps = transit_steps(router.route(NEAR_C, NEAR_D, departing(router, "2024-03-05 23:55")))
+    assert [step["transit_details"]["trip_id"] for step in steps] == ["R2_0620"]
+    assert steps[0]["transit_details"]["departure_time"]["value"] == departing(router, "2024-03-06 06:20")
+
+
+def test_no_transit_and_too_far_to_walk(router):
+    response = router.route((41.0, -87.0), (41.1, -87.0), departing(router, "2024-03-05 12:00"))
+    assert response["status"] == "ZERO_RESULTS"
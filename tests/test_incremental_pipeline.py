@@ -0,0 +1,87 @@
+from os import remove
+import numpy as np
+import pandas as pd
+import pytest
+from aggregate_cube import CUBE_KEYS, load_cube
+from benchmark import generate_ride_export, populate_archive
+from ride_times import convert_ride_times
+from time_splits_io import read_time_splits
+
+CHUNK_SIZE = 50 #several chunks, so rows carried over from the previous output cross chunk boundaries
+
+
+def write_rides(main, rides_df: pd.core.frame.DataFrame):
+    rides_df.to_csv(main.RIDES_FILE_PATH, index=False)
+    export_df = next(main.read_ride_export(main.RIDES_FILE_PATH, None))
+    missing_df = export_df[[ride_id not in main.get_archive_store() for ride_id in export_df.index.tolist()]]
+    populate_archive(main.get_archive_store(), main.pool_data(missing_df, convert_ride_times(missing_df, main.TARGET_WEEK)), seed=len(export_df))
+
+
+def read_outputs(main) -> dict:
+    cube = load_cube(main.CUBE_FILE_NAME)
+    return {"time_splits": read_time_splits(main.OUTPUT_FILE_NAME),
+            "comparison": read_time_splits(main.COMPARISON_FILE_NAME),
+            "cube": cube.groupby(CUBE_KEYS).sum(numeric_only=True).drop(columns="Block")}
+
+
+def assert_matches_full_rebuild(main):
+    incremental = read_outputs(main)
+    main.run_pipeline(None, full_rebuild=True, chunk_size=CHUNK_SIZE)
+    rebuilt = read_outputs(main)
+
+    pd.testing.assert_frame_equal(incremental["time_splits"], rebuilt["time_splits"])
+    pd.testing.assert_frame_equal(incremental["comparison"], rebuilt["comparison"])
+    pd.testing.assert_frame_equal(incremental["cube"], rebuilt["cube"], check_exact=False)
+
+
+def changed_rides(rides_df: pd.core.frame.DataFrame) -> pd.core.frame.DataFrame:
+    """Shifts the request of one ride by an hour and lengthens another."""
+    rides_df = rides_df.copy()
+    rides_df.loc[10, "Request Time (Local)"] = "3:15PM"
+    rides_df.loc[120, "Duration (min)"] += 7
+    return rides_df
+
+
+@pytest.fixture
+def processed(main_in_tmp_path):
+    main = main_in_tmp_path
+    rides_df = generate_ride_export(300)
+    write_rides(main, rides_df)
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE)
+    return main, rides_df
+
+
+def test_incremental_run_matches_full_rebuild(processed):
+    main, rides_df = processed
+    rides_df = pd.concat([changed_rides(rides_df), generate_ride_export(40, seed=1)], ignore_index=True)
+    write_rides(main, rides_df)
+    rng = np.random.default_rng(2)
+    main.get_archive_store().put_many([(200, {"geocoded_waypoints": [], "routes": [], "status": "ZERO_RESULTS"})]) #rewritten result
+    main.get_archive_store().delete(int(rng.integers(0, 300))) #result dropped
+
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE)
+    assert_matches_full_rebuild(main)
+
+
+def test_removed_rides_are_dropped(processed):
+    main, rides_df = processed
+    write_rides(main, rides_df.iloc[:250])
+
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE)
+    assert read_outputs(main)["time_splits"]["ID"].max() < 250
+    assert_matches_full_rebuild(main)
+
+
+def test_missing_output_is_rebuilt(processed):
+    main, rides_df = processed
+    row_count = len(read_outputs(main)["time_splits"])
+    remove(main.OUTPUT_FILE_NAME)
+
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE) #nothing changed, the output must still come back
+    assert len(read_outputs(main)["time_splits"]) == row_count
+
+    remove(main.OUTPUT_FILE_NAME)
+    write_rides(main, changed_rides(rides_df))
+    main.run_pipeline(None, chunk_size=CHUNK_SIZE)
+    assert len(read_outputs(main)["time_splits"]) == row_count
+    assert_matches_full_rebuild(main)
@@ -0,0 +1,22 @@
+import json
+from benchmark import generate_ride_export
+from pipeline_runner import MAIN_SETTINGS, run_main
+from test_incremental_pipeline import write_rides
+
+
+def test_processing_step_does_not_fetch_and_writes_metrics(main_in_tmp_path, monkeypatch):
+    main = main_in_tmp_path
+    write_rides(main, generate_ride_export(100))
+    main.get_archive_store().delete(3)
+    main.close_stores()
+    monkeypatch.setattr(main, "NEW_DATA", True)
+
+    def fetch(*args):
+        raise AssertionError("the processing step fetched")
+
+    monkeypatch.setattr(main, "fetch_planned_calls", fetch)
+    run_main("time_splits", {name: getattr(main, name) for name in MAIN_SETTINGS})
+
+    assert not main.NEW_DATA
+    with open(main.METRICS_FILE_NAME, 'r') as file:
+        assert json.load(file)["counters"]["rides_read"] == 100
@@ -0,0 +1,17 @@
+from inspect import getsourcefile
+import aggregate_cube
+import duration_distributions
+import render_charts
+from render_charts import figure_specs, fingerprint
+
+
+def test_figures_are_fingerprinted_by_the_modules_they_draw_with(monkeypatch):
+    specs = figure_specs("figures")
+    before = {name: fingerprint(*spec) for name, spec in specs.items()}
+
+    edited = {getsourcefile(aggregate_cube), getsourcefile(duration_distributions)}
+    original_hash_file = render_charts.hash_file
+    monkeypatch.setattr(render_charts, "hash_file", lambda path: "edited" if path in edited else original_hash_file(path))
+    after = {name: fingerprint(*spec) for name, spec in specs.items()}
+
+    assert all(before[name] != after[name] for name in specs)
@@ -0,0 +1,80 @@
+import time
+import pandas as pd
+import pytest
+from ride_times import convert_ride_times, parse_distinct, parse_local_datetimes
+
+
+def test_parse_distinct_matches_to_datetime():
+    column = pd.Series(["1/2/2023", "3/4/2023", "1/2/2023", " 3/4/2023"], dtype="string")
+    expected = pd.to_datetime(column.str.strip(), format="%m/%d/%Y")
+    pd.testing.assert_series_equal(parse_distinct(column, "%m/%d/%Y"), expected, check_names=False, check_dtype=False)
+
+
+def test_parse_distinct_keeps_missing_values_missing():
+    column = pd.Series(["1/2/2023", None, "3/4/2023", pd.NA], dtype="string")
+    parsed = parse_distinct(column, "%m/%d/%Y")
+    assert parsed.isna().tolist() == [False, True, False, True]
+    assert parsed[0] == pd.Timestamp("2023-01-02")
+    assert parsed[2] == pd.Timestamp("2023-03-04")
+
+
+def test_parse_distinct_all_missing():
+    column = pd.Series([None, None], dtype="string")
+    assert parse_distinct(column, "%m/%d/%Y").isna().all()
+
+
+def test_parse_local_datetimes_missing_date_or_time():
+    dates = pd.Series(["1/2/2023", None, "3/4/2023"], dtype="string")
+    times = pd.Series(["9:00AM", "9:00AM", None], dtype="string")
+    parsed = parse_local_datetimes(dates, times)
+    assert parsed[0] == pd.Timestamp("2023-01-02 09:00")
+    assert parsed[1:].isna().all()
+
+
+def unix(local_time: str) -> int:
+    return int(pd.Timestamp(local_time).timestamp())
+
+
+def export(rides: list) -> pd.core.frame.DataFrame:
+    """Ride export rows from (request date, request time, drop-off date, drop-off time)."""
+    return pd.DataFrame(rides, columns=["Request Date (Local)", "Request Time (Local)", "Drop-off Date (Local)", "Drop-off Time (Local)"], dtype="string")
+
+
+@pytest.fixture(params=["UTC", "America/Indiana/Indianapolis", "Asia/Kolkata", "Pacific/Auckland"])
+def host_timezone(request, monkeypatch):
+    """Runs a test with the process timezone set to each value, results must not depend on it."""
+    monkeypatch.setenv("TZ", request.param)
+    time.tzset()
+    yield request.param
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_convert_ride_times_independent_of_host_timezone(host_timezone):
+    rides = export([("3/6/2023", "12:30AM", "3/6/2023", "12:50AM"), #monday just after midnight, moved into the target week's monday
+                    ("3/12/2023", "1:50AM", "3/12/2023", "3:10AM"), #across the spring forward change, 20 minutes
+                    ("3/12/2023", "2:30AM", "3/12/2023", "3:10AM"), #skipped time, moved ahead to 3:00AM
+                    ("11/5/2023", "1:30AM", "11/5/2023", "1:50AM"), #repeated time, read as standard time
+                    ("11/5/2023", "12:50AM", "11/5/2023", "1:10AM")]) #into the repeated hour
+    ride_times = convert_ride_times(rides, "2/13/2025")
+
+    assert ride_times["Request Time"].tolist() == [unix("2025-02-10 00:30-05:00"),
+                                                  unix("2025-02-16 01:50-05:00"),
+                                                  unix("2025-02-16 02:30-05:00"),
+                                                  unix("2025-02-16 01:30-05:00"),
+                                                  unix("2025-02-16 00:50-05:00")]
+    assert ride_times["Drop-off Time"].tolist() == [unix("2023-03-06 00:50-05:00"),
+                                                   unix("2023-03-12 03:10-04:00"),
+                                                   unix("2023-03-12 03:10-04:00"),
+                                                   unix("2023-11-05 01:50-05:00"),
+                                                   unix("2023-11-05 01:10-05:00")]
+    assert ride_times["Ride Share - Total Time"].tolist() == [20 * 60, 20 * 60, 10 * 60, 20 * 60, 80 * 60]
+    assert ride_times["Hour"].tolist() == [0, 1, 2, 1, 0]
+
+
+def test_convert_ride_times_keeps_recorded_week(host_timezone):
+    rides = export([("3/6/2023", "12:30AM", "3/6/2023", "12:50AM"), ("7/4/2024", "11:59PM", "7/5/2024", "12:20AM")])
+    ride_times = convert_ride_times(rides, None)
+
+    assert ride_times["Request Time"].tolist() == [unix("2023-03-06 00:30-05:00"), unix("2024-07-04 23:59-04:00")]
+    assert ride_times["Ride Share - Total Time"].tolist() == [20 * 60, 21 * 60]
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import route_summary
+from archive_store import ArchiveStore
+from benchmark import RESPONSE_KINDS, RESPONSE_WEIGHTS, generate_directions_response
+from route_summary import load_route_summary
+
+
+def archive(path: str, ride_ids, seed: int = 0) -> ArchiveStore:
+    rng = np.random.default_rng(seed)
+    archive_store = ArchiveStore(path)
+    archive_store.put_many([(ride_id, generate_directions_response(rng, rng.choice(RESPONSE_KINDS, p=RESPONSE_WEIGHTS), 1700000000 + ride_id))
+                            for ride_id in ride_ids])
+    return archive_store
+
+
+def test_parallel_summary_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(route_summary, "PARALLEL_PARSE_THRESHOLD", 1)
+    monkeypatch.setattr(route_summary, "PARALLEL_CHUNK_SIZE", 7)
+    with archive(str(tmp_path / "archive.sqlite"), range(200)) as archive_store:
+        serial = load_route_summary(archive_store, str(tmp_path / "serial.csv"), workers=1)
+        parallel = load_route_summary(archive_store, str(tmp_path / "parallel.csv"), workers=3)
+
+    assert len(serial) == 200
+    pd.testing.assert_frame_equal(parallel, serial)
+    assert (tmp_path / "parallel.csv").read_bytes() == (tmp_path / "serial.csv").read_bytes()
+
+
+def test_cached_summary_matches_fresh_parse(tmp_path, monkeypatch):
+    monkeypatch.setattr(route_summary, "PARALLEL_PARSE_THRESHOLD", 1)
+    monkeypatch.setattr(route_summary, "PARALLEL_CHUNK_SIZE", 7)
+    with archive(str(tmp_path / "archive.sqlite"), range(100)) as archive_store:
+        load_route_summary(archive_store, str(tmp_path / "cached.csv"), workers=3)
+        rng = np.random.default_rng(1)
+        archive_store.put_many([(ride_id, generate_directions_response(rng, "TRANSIT", 1700000000)) for ride_id in range(90, 130)])
+        archive_store.delete(5)
+
+        updated = load_route_summary(archive_store, str(tmp_path / "cached.csv"), workers=3)
+        fresh = load_route_summary(archive_store, str(tmp_path / "fresh.csv"), workers=1)
+
+    assert 5 not in set(updated["ID"])
+    pd.testing.assert_frame_equal(updated, fresh)
@@ -0,0 +1,121 @@
+from contextlib import ExitStack
+from importlib.util import find_spec
+import pandas as pd
+from atomic_files import atomic_write
+
+PARQUET_AVAILABLE = find_spec("pyarrow") is not None #parquet output needs pyarrow, csv is used when it is not installed
+
+TIME_SPLIT_DTYPES = {"ID": "int64",
+                     "Pickup Latitude": "float64",
+                     "Pickup Longitude": "float64",
+                     "Transit Duration": "int32", #minutes
+                     "Hour": "int8",
+                     "Time Spent - Bus": "int32",
+                     "Time Spent - Walking": "int32",
+                     "Time Spent - Waiting": "int32"}
+
+FILTER_OPERATORS = {"==": lambda column, value: column == value,
+                    "!=": lambda column, value: column != value,
+                    "<": lambda column, value: column < value,
+                    "<=": lambda column, value: column <= value,
+                    ">": lambda column, value: column > value,
+                    ">=": lambda column, value: column >= value,
+                    "in": lambda column, value: column.isin(value)}
+
+
+def is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def import_pyarrow():
+    """Imports pyarrow on first use, so scripts that only read csv files do not pay for it."""
+    if not PARQUET_AVAILABLE:
+        raise ImportError("reading and writing parquet time splits requires pyarrow")
+
+    import pyarrow
+    import pyarrow.parquet
+    return pyarrow, pyarrow.parquet
+
+
+def read_time_splits(path: str, columns: list = None, filters: list = None) -> pd.core.frame.DataFrame:
+    """Reads a time splits file, loading only the given columns and rows matching every (column, operator, value) filter.
+
+    For parquet files both are pushed into the read, so skipped columns are never decoded and row groups whose
+    statistics rule out the filters are never loaded. Csv files are filtered after reading."""
+    if is_parquet(path):
+        pa, pq = import_pyarrow()
+        return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+
+    filter_columns = [column for column, operator, value in filters or []]
+    usecols = None if columns is None else list(dict.fromkeys(columns + filter_columns))
+    df = pd.read_csv(path, usecols=usecols) if usecols is not None else pd.read_csv(path, index_col=0)
+    for column, operator, value in filters or []:
+        df = df[FILTER_OPERATORS[operator](df[column], value)]
+
+    return df.reset_index(drop=True) if columns is None else df[columns].reset_index(drop=True)
+
+
+def iter_time_splits(path: str, chunk_size: int = None, columns: list = None):
+    """Streams a time splits file in chunks of about chunk_size rows, None reads it whole."""
+    if is_parquet(path):
+        if chunk_size is None:
+            yield read_time_splits(path, columns)
+            return
+
+        pa, pq = import_pyarrow()
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    read_options = {"index_col": 0} if columns is None else {"usecols": columns}
+    if chunk_size is None:
+        yield pd.read_csv(path, **read_options)
+        return
+
+    with pd.read_csv(path, chunksize=chunk_size, **read_options) as chunks:
+        yield from chunks
+
+
+class TimeSplitsFileWriter:
+    """Writes a time splits file one chunk at a time with fixed column types, as parquet or csv by extension.
+
+    Column types are looked up in dtypes, so other per ride tables can be written the same way.
+    Rows go to a temporary file that replaces path once closed, so the previous file stays readable meanwhile."""
+
+    def __init__(self, path: str, columns: list, dtypes: dict = TIME_SPLIT_DTYPES):
+        if is_parquet(path):
+            import_pyarrow()
+
+        self.path = path
+        self.columns = columns
+        self.dtypes = {column: dtypes[column] for column in columns}
+        self.rows_written = 0
+        self._parquet_writer = None
+        self._atomic_write = ExitStack()
+        self.temp_path = self._atomic_write.enter_context(atomic_write(path))
+
+    def write(self, df: pd.core.frame.DataFrame):
+        """Appends a chunk of rows."""
+        df = df[self.columns].astype(self.dtypes)
+
+        if is_parquet(self.path):
+            pa, pq = import_pyarrow()
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.temp_path, table.schema)
+            self._parquet_writer.write_table(table)
+
+        else:
+            df = df.set_axis(range(self.rows_written, self.rows_written + len(df)))
+            df.to_csv(self.temp_path, mode="w" if self.rows_written == 0 else "a", header=self.rows_written == 0)
+
+        self.rows_written += len(df)
+
+    def close(self):
+        """Replaces the file at path with everything written so far."""
+        if self.rows_written == 0: #the schema and headers are still expected when no rows were produced
+            self.write(pd.DataFrame(columns=self.columns))
+
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        self._atomic_write.close()